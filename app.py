@@ -1,13 +1,20 @@
 import streamlit as st
+import markdown
 import logging
+import os
 import re
-from src.processor import processEmailData
-from src.agent import (
-    initializeGeminiAgent, 
-    analyzeEmailBatch, 
-    chatWithEmailExpert, 
-    analyzeSingleEmailForImprovement
-)
+import json
+import time
+import hashlib
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
 
 # Configure logging
 logging.basicConfig(
@@ -17,6 +24,59 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Cache locations and lifetimes
+CACHE_DIR = Path(__file__).resolve().parent / '.cache'
+CACHE_FILE = CACHE_DIR / 'analysis_cache.json'
+ANALYSIS_CACHE_FILE = CACHE_DIR / 'analysis.md'
+CONTEXT_CACHE_FILE = CACHE_DIR / 'email_context.txt'
+CHAT_LOG_DIR = CACHE_DIR / 'chat_logs'
+CHAT_LOG_IO_BUFFER_SIZE = 1 << 16  # bytes
+CHAT_LOG_MAX_MESSAGES = 200  # messages kept in a session's log
+CHAT_LOG_TTL = 7 * 24 * 60 * 60  # seconds since a log was last written
+CACHE_IO_BUFFER_SIZE = 1 << 20  # bytes
+
+# Email fields whose changes invalidate the cached analysis
+DATA_HASH_COLUMNS = ['subject', 'plaintext', 'message_body', 'mcsent', 'mcopened', 'mcclicked', 'mcunsub']
+
+# Number of most recent chat messages rendered by default
+CHAT_HISTORY_WINDOW = 20
+
+# Opt-in balloons animation when an analysis completes
+CELEBRATE_ANALYSIS = os.getenv("CELEBRATE_ANALYSIS", "false").lower() == "true"
+
+# Long user messages are shown truncated to this many characters
+MESSAGE_PREVIEW_LENGTH = 500
+
+# Approximate token budget for the conversation history sent with each question
+CHAT_HISTORY_TOKEN_BUDGET = 4000
+
+# Quick question buttons: (button label, question sent to the expert)
+QUICK_QUESTIONS = [
+    ("How to improve open rates?", "How can I improve my open rates?"),
+    ("What makes a good subject line?", "What makes a good subject line?"),
+    ("How to reduce unsubscribes?", "How to reduce unsubscribe rates?"),
+    ("Best practices for CTAs?", "Best practices for email CTAs?")
+]
+
+# Opt-in pre-computation of the quick question answers; it spends one request per question
+WARM_QUICK_QUESTIONS = os.getenv("WARM_QUICK_QUESTIONS", "false").lower() == "true"
+
+# Chat log IDs are random hex tokens, also carried in the page URL so a reload restores the chat
+CHAT_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# Gemini quota error detection
+RETRY_DELAY_PATTERN = re.compile(r'retry in ([\d.]+)s', re.IGNORECASE)
+DAILY_LIMIT_PATTERN = re.compile(r'GenerateRequestsPerDay|free_tier_requests|limit: 20')
+DAILY_LIMIT_MESSAGE = """
+⚠️ **Daily Limit Reached**
+
+You have reached the daily limit of 20 requests on the free tier of Gemini API.
+
+**You must wait until tomorrow** for the limit to reset automatically.
+
+The limit resets daily at 00:00 UTC.
+"""
+
 # Page configuration
 st.set_page_config(
     page_title="Email Marketing Expert Agent",
@@ -25,127 +85,643 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+@st.cache_resource(show_spinner="Initializing AI agent...")
+def getGeminiModel():
+    """
+    Get the Gemini model shared by every session and rerun.
+    The agent is initialized once per server process instead of once per browser session.
+    """
+    # Imported on first use to keep the Gemini SDK off the first-render path
+    from src.agent import getSharedModel
+    return getSharedModel()
+
+@st.cache_data(ttl=3600, show_spinner="Loading emails from database...")
+def loadEmailData():
+    """
+    Load processed email data, cached for an hour.
+    Use the sidebar reload button to force a fresh database read.
+    """
+    from src.processor import processEmailData
+    return processEmailData()
+
+@st.cache_data(show_spinner=False)
+def buildEmailContext(email_data):
+    """
+    Build the performance summary passed to the chat expert as context.
+    Cached on the DataFrame contents so the aggregates are computed once per dataset.
+    
+    Args:
+        email_data: Processed email DataFrame
+    
+    Returns:
+        Summary string
+    """
+    averages = email_data[['openRate', 'clickRate', 'unsubRate']].agg('mean')
+    scores = email_data['effectivenessScore']
+    topSubject = email_data.loc[scores.idxmax(), 'subject'] if scores.notna().any() else 'N/A'
+    return f"""
+Email Performance Summary:
+- Total emails analyzed: {len(email_data)}
+- Average open rate: {averages['openRate']:.2f}%
+- Average click rate: {averages['clickRate']:.2f}%
+- Average unsubscribe rate: {averages['unsubRate']:.2f}%
+- Top performing email subject: {topSubject}
+"""
+
+@st.cache_data(show_spinner=False)
+def renderMarkdownToHtml(text):
+    """
+    Convert Markdown to HTML once per distinct text.
+    Used for the (large) analysis report so it is not re-parsed on every rerun.
+    
+    Args:
+        text: Markdown text
+    
+    Returns:
+        HTML string
+    """
+    return markdown.markdown(text, extensions=['fenced_code', 'tables'])
+
+def formatCacheTimestamp(timestamp):
+    """
+    Format a cache timestamp for display.
+    Not wrapped in st.cache_data: hashing the argument costs more than parsing the ISO string.
+    
+    Args:
+        timestamp: ISO formatted timestamp string
+    
+    Returns:
+        Display string, or the raw timestamp if it cannot be parsed
+    """
+    try:
+        return datetime.fromisoformat(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return timestamp
+
+def classifyQuotaError(error):
+    """
+    Classify a Gemini error as a daily quota, a per-minute rate limit or another failure.
+    
+    Args:
+        error: Exception raised by an agent call
+    
+    Returns:
+        Tuple (kind, waitTime) where kind is 'daily', 'rate' or 'other' and
+        waitTime is the retry delay in seconds reported for rate limits, or None
+    """
+    errorStr = str(error)
+    if "429" not in errorStr and "ResourceExhausted" not in errorStr:
+        return 'other', None
+    
+    if DAILY_LIMIT_PATTERN.search(errorStr):
+        return 'daily', None
+    
+    match = RETRY_DELAY_PATTERN.search(errorStr)
+    return 'rate', float(match.group(1)) if match else None
+
+def getGeminiErrorMessage(error):
+    """
+    Build the user-facing message for a failed expert request.
+    
+    Args:
+        error: Exception raised by an agent call
+    
+    Returns:
+        Markdown message string
+    """
+    kind, waitTime = classifyQuotaError(error)
+    if kind == 'daily':
+        return DAILY_LIMIT_MESSAGE
+    if kind == 'rate' and waitTime is not None:
+        return f"⚠️ Rate limit exceeded. Please wait {waitTime:.0f} seconds and try again."
+    return f"Error: {str(error)}"
+
+def calculateDataHash(email_data):
+    """
+    Calculate a hash of the email fields that feed the analysis.
+    Used to detect whether the data changed since the cached analysis was generated.
+    Each column is hashed in a vectorized pass and streamed into the digest in turn,
+    so no combined copy of the data is ever built.
+    
+    Args:
+        email_data: Processed email DataFrame
+    
+    Returns:
+        16-character hex digest string
+    """
+    import pandas as pd
+    
+    hasher = hashlib.blake2b(digest_size=8)
+    for column in DATA_HASH_COLUMNS:
+        if column not in email_data.columns:
+            continue
+        hasher.update(column.encode('utf-8'))
+        hasher.update(pd.util.hash_pandas_object(email_data[column], index=False).to_numpy())
+    return hasher.hexdigest()
+
+def getDataChangeProxy(email_data):
+    """
+    Build a cheap fingerprint of the email data: row count, latest modification time and metric totals.
+    Lets a session skip calculateDataHash when the data it hashed before is evidently unchanged.
+    
+    Args:
+        email_data: Processed email DataFrame
+    
+    Returns:
+        Tuple that changes whenever rows, modification times or send metrics change
+    """
+    metricColumns = [col for col in ['mcsent', 'mcopened', 'mcclicked', 'mcunsub'] if col in email_data.columns]
+    lastModified = email_data['dlm'].max() if 'dlm' in email_data.columns else None
+    return (len(email_data), str(lastModified), tuple(email_data[metricColumns].sum().tolist()))
+
+def encodeJson(data):
+    """
+    Serialize data to compact, single-line JSON bytes, using orjson when it is installed.
+    
+    Args:
+        data: JSON-serializable object
+    
+    Returns:
+        JSON bytes
+    """
+    if orjson:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode('ascii')
+
+def decodeJson(raw):
+    """
+    Parse UTF-8 JSON bytes, using orjson when it is installed.
+    
+    Args:
+        raw: JSON bytes
+    
+    Returns:
+        Parsed object
+    """
+    if orjson:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+@st.cache_data(show_spinner=False)
+def readAnalysisCacheFile(cacheMtime):
+    """
+    Read the analysis cache: the small JSON metadata file plus the analysis and context sidecars.
+    Cached per metadata modification time, so the files are only read again after the cache changes.
+    
+    Args:
+        cacheMtime: Modification time of the cache file (nanoseconds), used as the cache key
+    
+    Returns:
+        Cache dictionary, or None if the file cannot be read
+    """
+    try:
+        with open(CACHE_FILE, 'rb', buffering=CACHE_IO_BUFFER_SIZE) as f:
+            cacheData = decodeJson(f.read())
+        cacheData['analysis_result'] = ANALYSIS_CACHE_FILE.read_text(encoding='utf-8')
+        cacheData['email_context'] = CONTEXT_CACHE_FILE.read_text(encoding='utf-8')
+        return cacheData
+    except Exception as e:
+        logger.warning(f"Failed to load analysis cache: {str(e)}")
+        return None
+
+def loadCachedAnalysis():
+    """
+    Load the cached analysis from disk.
+    The parsed cache is kept in session state for the current file version, so reruns
+    skip both the parse and the copy that st.cache_data makes on every hit.
+    
+    Returns:
+        Cache dictionary, or None if there is no readable cache
+    """
+    try:
+        cacheMtime = CACHE_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    
+    if st.session_state.get('analysis_cache_mtime') == cacheMtime:
+        return st.session_state.get('analysis_cache')
+    
+    cachedAnalysis = readAnalysisCacheFile(cacheMtime)
+    st.session_state.analysis_cache_mtime = cacheMtime
+    st.session_state.analysis_cache = cachedAnalysis
+    return cachedAnalysis
+
+def writeCacheFile(path, data):
+    """
+    Write a cache file atomically: write a temporary file and swap it in,
+    so readers never see a partial file.
+    
+    Args:
+        path: Destination path
+        data: File contents (bytes)
+    """
+    tempFile = path.with_name(path.name + '.tmp')
+    with open(tempFile, 'wb', buffering=CACHE_IO_BUFFER_SIZE) as f:
+        f.write(data)
+    os.replace(tempFile, path)
+
+def saveAnalysisToCache(data_hash, analysis_result, email_context, email_data):
+    """
+    Save an analysis to disk so it can be reused while the email data is unchanged.
+    The analysis and context are stored as plain text sidecars next to a small JSON metadata file,
+    so the large text is never JSON-escaped.
+    
+    Args:
+        data_hash: Hash of the analyzed email data
+        analysis_result: Analysis text returned by Gemini
+        email_context: Summary context for the chat expert
+        email_data: Processed email DataFrame
+    """
+    # Nothing to write if the cache already holds an analysis of this data
+    existingCache = loadCachedAnalysis()
+    if existingCache and existingCache.get('data_hash') == data_hash:
+        logger.info("Analysis cache already up to date")
+        return
+    
+    cache_data = {
+        'data_hash': data_hash,
+        'timestamp': datetime.now().isoformat(),
+        'email_count': len(email_data)
+    }
+    
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        
+        # The metadata file marks the cache as valid, so drop it while the sidecars are replaced
+        CACHE_FILE.unlink(missing_ok=True)
+        writeCacheFile(ANALYSIS_CACHE_FILE, analysis_result.encode('utf-8'))
+        writeCacheFile(CONTEXT_CACHE_FILE, email_context.encode('utf-8'))
+        writeCacheFile(CACHE_FILE, encodeJson(cache_data))
+        logger.info(f"Analysis cached to {CACHE_DIR}")
+    except Exception as e:
+        logger.warning(f"Failed to save analysis cache: {str(e)}")
+
+def getChatLogFile():
+    """
+    Get the chat log file of the current browser session.
+    Each session gets its own random chat ID, kept in the page URL so reloading the page
+    restores the same conversation while other sessions never see it.
+    
+    Returns:
+        Path of the session's JSONL chat log
+    """
+    chatId = st.session_state.get('chat_id')
+    if chatId is None:
+        chatId = st.query_params.get('chat')
+        if not chatId or not CHAT_ID_PATTERN.match(chatId):
+            chatId = uuid.uuid4().hex
+            st.query_params['chat'] = chatId
+        st.session_state.chat_id = chatId
+    return CHAT_LOG_DIR / f"{chatId}.jsonl"
+
+def appendChatLog(entries):
+    """
+    Append conversation messages to the session's chat log, one JSON object per line.
+    Only the new messages are written, so each turn costs the same regardless of history length.
+    Once the log holds twice CHAT_LOG_MAX_MESSAGES, it is rewritten with the most recent ones.
+    
+    Args:
+        entries: List of message dictionaries to append
+    """
+    try:
+        chatLogFile = getChatLogFile()
+        logLength = st.session_state.get('chat_log_length', 0) + len(entries)
+        if logLength > 2 * CHAT_LOG_MAX_MESSAGES:
+            recentMessages = st.session_state.conversation_history[-CHAT_LOG_MAX_MESSAGES:]
+            writeCacheFile(chatLogFile, b''.join(encodeJson(message) + b'\n' for message in recentMessages))
+            st.session_state.chat_log_length = len(recentMessages)
+            return
+        
+        CHAT_LOG_DIR.mkdir(parents=True, exist_ok=True)
+        with open(chatLogFile, 'ab', buffering=CHAT_LOG_IO_BUFFER_SIZE) as f:
+            for entry in entries:
+                f.write(encodeJson(entry) + b'\n')
+        st.session_state.chat_log_length = logLength
+    except Exception as e:
+        logger.warning(f"Failed to append to chat log: {str(e)}")
+
+def loadChatLog():
+    """
+    Load the conversation history saved in the session's chat log.
+    
+    Returns:
+        List of message dictionaries (empty if there is no readable log)
+    """
+    try:
+        raw = getChatLogFile().read_bytes()
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        logger.warning(f"Failed to load chat log: {str(e)}")
+        return []
+    
+    messages = []
+    lineCount = 0
+    for line in raw.splitlines():
+        if not line.strip():
+            continue
+        lineCount += 1
+        try:
+            messages.append(decodeJson(line))
+        except ValueError:
+            # A partially written last line is skipped rather than failing the restore
+            logger.warning("Skipping unreadable chat log line")
+    # Compaction is based on the lines in the file, which can be more than the messages restored
+    st.session_state.chat_log_length = lineCount
+    return messages[-CHAT_LOG_MAX_MESSAGES:]
+
+def pruneChatLogs():
+    """Delete chat logs that have not been written for CHAT_LOG_TTL, so old sessions do not pile up."""
+    cutoff = time.time() - CHAT_LOG_TTL
+    try:
+        for chatLogFile in CHAT_LOG_DIR.glob('*.jsonl'):
+            if chatLogFile.stat().st_mtime < cutoff:
+                chatLogFile.unlink(missing_ok=True)
+    except Exception as e:
+        logger.warning(f"Failed to prune chat logs: {str(e)}")
+
+def initializeSessionState():
+    """Set defaults for the session state keys the app relies on."""
+    defaults = {
+        'analysis_results': None,
+        'conversation_history': [],
+        'email_context': None
+    }
+    for key, value in defaults.items():
+        st.session_state.setdefault(key, value)
+
 # Initialize session state
-if 'gemini_model' not in st.session_state:
-    st.session_state.gemini_model = None
-if 'analysis_results' not in st.session_state:
-    st.session_state.analysis_results = None
-if 'conversation_history' not in st.session_state:
-    st.session_state.conversation_history = []
-if 'email_context' not in st.session_state:
-    st.session_state.email_context = None
+initializeSessionState()
+
+# Restore the last cached analysis and the saved conversation on first load
+if not st.session_state.get('analysis_loaded'):
+    cachedAnalysis = loadCachedAnalysis()
+    if cachedAnalysis:
+        st.session_state.analysis_results = cachedAnalysis.get('analysis_result')
+        st.session_state.email_context = cachedAnalysis.get('email_context')
+        st.session_state.analysis_cached_at = cachedAnalysis.get('timestamp')
+    if not st.session_state.conversation_history:
+        pruneChatLogs()
+        st.session_state.conversation_history = loadChatLog()
+    st.session_state.analysis_loaded = True
+
+def getChatRequestInputs(question, history, emailContext):
+    """
+    Build the inputs of an expert chat request.
+    Shared by the chat input, the quick question buttons and the quick question warm-up,
+    so a warmed answer is cached under the same prompt a click sends.
+    
+    Args:
+        question: Question sent to the expert
+        history: Full conversation history of the session
+        emailContext: Email performance summary, or None
+    
+    Returns:
+        Dict with the question, the trimmed history sent to the model and the context
+    """
+    from src.agent import trimConversationHistory
+    
+    # Only the most recent messages are sent to the model; the full history stays on screen
+    return {
+        'question': question,
+        'history': trimConversationHistory(history, CHAT_HISTORY_TOKEN_BUDGET),
+        'context': emailContext
+    }
+
+@st.cache_resource(show_spinner=False)
+def startQuickQuestionWarmup(emailContext):
+    """
+    Pre-compute the quick question answers for a new conversation in a background thread,
+    so the buttons respond instantly. Runs at most once per server process and email context;
+    answers are stored in the agent's response cache, so questions already cached cost no request.
+    
+    Args:
+        emailContext: Email performance summary
+    """
+    try:
+        model = getGeminiModel()
+        warmRequests = [getChatRequestInputs(question, [], emailContext) for _, question in QUICK_QUESTIONS]
+    except Exception as e:
+        logger.warning(f"Skipping quick question warm-up: {str(e)}")
+        return
+    
+    from src.agent import chatWithEmailExpert
+    
+    def warm():
+        for requestInputs in warmRequests:
+            try:
+                chatWithEmailExpert(model, requestInputs['question'], requestInputs['history'], requestInputs['context'])
+            except Exception as e:
+                logger.warning(f"Stopping quick question warm-up: {str(e)}")
+                return
+        logger.info(f"Warmed {len(warmRequests)} quick question answers")
+    
+    threading.Thread(target=warm, name="quick-question-warmup", daemon=True).start()
 
 def runCompleteAnalysis():
     """
     Run complete email analysis automatically.
     This function does everything: initializes agent, loads data, and analyzes.
     """
-    # Step 1: Initialize agent if needed
-    if st.session_state.gemini_model is None:
-        with st.spinner("Initializing AI agent..."):
-            try:
-                st.session_state.gemini_model = initializeGeminiAgent()
-            except Exception as e:
-                st.error(f"Failed to initialize agent: {str(e)}")
-                return False
+    # Step 1: Initialize agent (cached across sessions)
+    try:
+        model = getGeminiModel()
+    except Exception as e:
+        st.error(f"Failed to initialize agent: {str(e)}")
+        return False
     
-    # Step 2: Load email data
-    with st.spinner("Loading emails from database..."):
-        try:
-            email_data = processEmailData()
-            if email_data.empty:
-                st.error("No email data found in database")
-                return False
-        except Exception as e:
-            st.error(f"Failed to load email data: {str(e)}")
+    # Step 2: Load email data (cached)
+    try:
+        email_data = loadEmailData()
+        if email_data.empty:
+            st.error("No email data found in database")
             return False
+    except Exception as e:
+        st.error(f"Failed to load email data: {str(e)}")
+        return False
+    
+    # Step 3: Reuse the cached analysis if the email data has not changed
+    # The content hash is only recomputed when the cheap change proxy moves
+    dataProxy = getDataChangeProxy(email_data)
+    if st.session_state.get('data_hash_proxy') == dataProxy:
+        data_hash = st.session_state.data_hash
+    else:
+        data_hash = calculateDataHash(email_data)
+        st.session_state.data_hash_proxy = dataProxy
+        st.session_state.data_hash = data_hash
+    cachedAnalysis = loadCachedAnalysis()
+    if cachedAnalysis and cachedAnalysis.get('data_hash') == data_hash:
+        logger.info("Email data unchanged, using cached analysis")
+        st.session_state.analysis_results = cachedAnalysis.get('analysis_result')
+        st.session_state.email_context = cachedAnalysis.get('email_context')
+        st.session_state.analysis_cached_at = cachedAnalysis.get('timestamp')
+        return True
     
-    # Step 3: Run analysis
+    # Step 4: Run analysis
+    from src.agent import analyzeEmailBatch
     with st.spinner("Analyzing emails with AI... This may take a few minutes."):
+        progressBar = st.progress(0.0, text="Analyzing email batches...")
+        
+        def updateProgress(completed, total):
+            progressBar.progress(completed / total, text=f"Analyzed batch {completed}/{total}")
+        
+        # Show the final summary as it streams in instead of waiting for the whole report
+        finalPreview = st.empty()
+        finalChunks = []
+        
+        def showFinalChunk(text):
+            finalChunks.append(text)
+            finalPreview.markdown("".join(finalChunks))
+        
         try:
             analysis = analyzeEmailBatch(
                 email_data, 
-                st.session_state.gemini_model, 
-                batchSize=3
+                model, 
+                maxConcurrency=4,
+                requestsPerMinute=15,
+                progressCallback=updateProgress,
+                finalChunkCallback=showFinalChunk
             )
             st.session_state.analysis_results = analysis
             
             # Create context summary for chat
-            topEmails = email_data.nlargest(3, 'effectivenessScore')
-            summary = f"""
-Email Performance Summary:
-- Total emails analyzed: {len(email_data)}
-- Average open rate: {email_data['openRate'].mean():.2f}%
-- Average click rate: {email_data['clickRate'].mean():.2f}%
-- Average unsubscribe rate: {email_data['unsubRate'].mean():.2f}%
-- Top performing email subject: {topEmails.iloc[0]['subject'] if len(topEmails) > 0 else 'N/A'}
-"""
-            st.session_state.email_context = summary
+            st.session_state.email_context = buildEmailContext(email_data)
             
+            saveAnalysisToCache(data_hash, analysis, st.session_state.email_context, email_data)
+            # Freshly computed, so no "cached analysis" banner
+            st.session_state.analysis_cached_at = False
             return True
         except Exception as e:
-            errorStr = str(e)
-            
-            # Detect daily limit
-            if "429" in errorStr or "ResourceExhausted" in errorStr:
-                if "GenerateRequestsPerDay" in errorStr or "free_tier_requests" in errorStr or "limit: 20" in errorStr:
-                    st.error("""
-                    ⚠️ **Daily Limit Reached**
-                    
-                    You have reached the daily limit of 20 requests on the free tier of Gemini API.
-                    
-                    **You must wait until tomorrow** for the limit to reset automatically.
-                    
-                    The limit resets daily at 00:00 UTC.
-                    """)
-                    return False
-                else:
-                    # Rate limit (per minute) - can retry
-                    match = re.search(r'retry in ([\d.]+)s', errorStr, re.IGNORECASE)
-                    if match:
-                        waitTime = float(match.group(1))
-                        st.warning(f"⚠️ Rate limit exceeded. Please wait {waitTime:.0f} seconds and try again.")
-                    else:
-                        st.error(f"Quota error: {str(e)}")
+            kind, waitTime = classifyQuotaError(e)
+            if kind == 'daily':
+                st.error(DAILY_LIMIT_MESSAGE)
+            elif kind == 'rate' and waitTime is not None:
+                # Rate limit (per minute) - can retry
+                st.warning(f"⚠️ Rate limit exceeded. Please wait {waitTime:.0f} seconds and try again.")
+            elif kind == 'rate':
+                st.error(f"Quota error: {str(e)}")
             else:
                 st.error(f"Analysis failed: {str(e)}")
             return False
+        finally:
+            progressBar.empty()
+            finalPreview.empty()
 
-# Main UI
-st.title("📧 Email Marketing Expert Agent")
-st.markdown("---")
-
-# Two main modes
-tab1, tab2 = st.tabs(["📊 Analysis Mode", "💬 Interactive Chat"])
-
-# TAB 1: Analysis Mode
-with tab1:
-    st.header("📊 Complete Email Analysis")
-    st.markdown("Click the button below to automatically analyze all emails from your database.")
+def runExpertExchange(userMessage, streamResponse):
+    """
+    Show a user message and stream the expert's reply below it, then record both in the history.
+    Shared by the chat input, the quick question buttons and the single-email analyzer.
+    Repeated requests are answered from the agent's response cache.
     
-    if st.button("🚀 Run Complete Analysis", use_container_width=True, type="primary", key="run_analysis"):
-        if runCompleteAnalysis():
-            st.success("✅ Analysis completed successfully!")
-            st.balloons()
+    Args:
+        userMessage: Text recorded as the user's turn
+        streamResponse: Zero-argument callable returning an iterator of response text chunks
+    """
+    # Display the user message
+    userEntry = {
+        'role': 'user',
+        'content': userMessage
+    }
+    if len(userMessage) > MESSAGE_PREVIEW_LENGTH:
+        # Precompute the display preview once instead of on every rerun
+        userEntry['preview'] = userMessage[:MESSAGE_PREVIEW_LENGTH] + "..."
+    renderMessages([userEntry])
     
-    # Display analysis results
-    if st.session_state.analysis_results:
-        st.markdown("---")
-        st.markdown("### 📄 Analysis Results")
-        st.markdown(st.session_state.analysis_results)
+    # Get expert response, streaming it as it is generated
+    with st.chat_message("assistant"):
+        try:
+            with st.spinner("Expert is thinking..."):
+                responseChunks = streamResponse()
+            response = st.write_stream(responseChunks)
+        except Exception as e:
+            response = getGeminiErrorMessage(e)
+            st.error(response)
+    
+    # Record the question and answer together so the history never holds an unanswered turn
+    exchange = [
+        userEntry,
+        {
+            'role': 'assistant',
+            'content': response
+        }
+    ]
+    st.session_state.conversation_history.extend(exchange)
+    appendChatLog(exchange)
+
+def renderMessages(messages):
+    """
+    Render conversation messages as chat bubbles.
+    
+    Args:
+        messages: List of message dictionaries with 'role' and 'content'
+    """
+    for msg in messages:
+        role = msg.get('role', 'user')
+        content = msg.get('content', '')
         
-        st.info("💡 **Tip**: Switch to 'Interactive Chat' tab to ask questions about this analysis or get recommendations for specific emails.")
+        if role == 'user':
+            with st.chat_message("user"):
+                # Very long messages carry a truncated preview for display
+                preview = msg.get('preview')
+                if preview:
+                    st.write(preview)
+                    with st.expander("View full message"):
+                        st.write(content)
+                else:
+                    st.write(content)
+        else:
+            with st.chat_message("assistant"):
+                st.markdown(content)
 
-# TAB 2: Interactive Chat Mode
-with tab2:
-    st.header("💬 Interactive Chat with Email Expert")
+def queueExpertRequest(kind, question=None):
+    """
+    Queue an expert request and mark the chat as busy (input callback), so the inputs render
+    disabled until the reply is recorded. The request is kept in session state rather than read
+    from the widget's return value, because a widget rendered disabled reports no click.
     
-    if st.session_state.analysis_results is None:
-        st.info("ℹ️ **Note**: Run the analysis first in the 'Analysis Mode' tab to get better context-aware responses.")
-    else:
-        st.success("✅ Analysis context loaded. The expert can reference your email performance data.")
+    Args:
+        kind: 'chat' (chat input), 'quick' (quick question button) or 'email' (single-email analyzer)
+        question: Question of a quick question button
+    """
+    if st.session_state.get('processing'):
+        return
+    if kind == 'chat':
+        question = st.session_state.get('chat_question')
+    st.session_state.pending_request = (kind, question)
+    # An empty email only gets a warning, so the inputs stay enabled
+    if kind != 'email' or st.session_state.get('email_content'):
+        st.session_state.processing = True
+
+def isFragmentRerun():
+    """Check whether the current script run reruns fragments only, rather than the whole app."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
     
-    st.markdown("---")
+    ctx = get_script_run_ctx()
+    return bool(ctx and ctx.fragment_ids_this_run)
+
+def clearChatHistory():
+    """Clear the conversation history and the session's saved log (button callback)."""
+    st.session_state.conversation_history = []
+    st.session_state.chat_log_length = 0
+    try:
+        getChatLogFile().unlink(missing_ok=True)
+    except Exception as e:
+        logger.warning(f"Failed to remove chat log: {str(e)}")
+
+@st.fragment
+def renderChatPanel():
+    """
+    Render the single-email analyzer, the conversation and the chat inputs.
+    Runs as a fragment so chat interactions rerun only this panel instead of the whole app.
+    """
+    # Exchange to run once the conversation is rendered: (userMessage, streamResponse)
+    pendingExchange = None
+    
+    # Set by the input callbacks before this run; inputs stay disabled while the reply is generated.
+    # A flag left set by an interrupted run has no queued request and is cleared
+    requestKind, requestQuestion = st.session_state.pop('pending_request', (None, None))
+    processing = st.session_state.get('processing', False) and requestKind is not None
+    st.session_state.processing = processing
     
     # Section: Analyze a specific email
     with st.expander("📝 Analyze a Specific Email", expanded=False):
@@ -159,48 +735,21 @@ with tab2:
             key="email_content"
         )
         
-        if st.button("🔍 Analyze This Email", use_container_width=True, type="primary", key="analyze_single"):
+        st.button("🔍 Analyze This Email", use_container_width=True, type="primary", key="analyze_single",
+                  on_click=queueExpertRequest, args=('email',), disabled=processing)
+        if requestKind == 'email':
             if not email_content:
                 st.warning("⚠️ Please paste email content first.")
-            elif st.session_state.gemini_model is None:
-                st.warning("⚠️ Please run the analysis first to initialize the agent.")
             else:
-                with st.spinner("Analyzing email and generating recommendations..."):
-                    try:
-                        recommendations = analyzeSingleEmailForImprovement(
-                            st.session_state.gemini_model,
-                            email_content,
-                            email_subject if email_subject else None
-                        )
-                        
-                        # Add to conversation history
-                        user_msg = f"Please analyze this email:\n\nSubject: {email_subject if email_subject else 'N/A'}\n\nContent:\n{email_content}"
-                        st.session_state.conversation_history.append({
-                            'role': 'user',
-                            'content': user_msg
-                        })
-                        st.session_state.conversation_history.append({
-                            'role': 'assistant',
-                            'content': recommendations
-                        })
-                        
-                        st.success("✅ Analysis complete! Check the chat below.")
-                        st.rerun()
-                    except Exception as e:
-                        errorStr = str(e)
-                        if "429" in errorStr or "ResourceExhausted" in errorStr:
-                            if "GenerateRequestsPerDay" in errorStr or "free_tier_requests" in errorStr or "limit: 20" in errorStr:
-                                st.error("""
-                                ⚠️ **Daily Limit Reached**
-                                
-                                You have reached the daily limit of 20 requests on the free tier.
-                                
-                                **You must wait until tomorrow** to continue using the service.
-                                """)
-                            else:
-                                st.error(f"Error: {str(e)}")
-                        else:
-                            st.error(f"Error: {str(e)}")
+                from src.agent import streamSingleEmailForImprovement
+                pendingExchange = (
+                    f"Please analyze this email:\n\nSubject: {email_subject if email_subject else 'N/A'}\n\nContent:\n{email_content}",
+                    lambda: streamSingleEmailForImprovement(
+                        getGeminiModel(),
+                        email_content,
+                        email_subject if email_subject else None
+                    )
+                )
     
     st.markdown("---")
     
@@ -208,150 +757,124 @@ with tab2:
     st.markdown("### 💬 Chat with Expert")
     st.markdown("Ask questions about email marketing, get advice, or discuss your email performance.")
     
-    # Display conversation history
-    if st.session_state.conversation_history:
-        for msg in st.session_state.conversation_history:
-            role = msg.get('role', 'user')
-            content = msg.get('content', '')
-            
-            if role == 'user':
-                with st.chat_message("user"):
-                    # Truncate very long messages for display
-                    if len(content) > 500:
-                        st.write(content[:500] + "...")
-                        with st.expander("View full message"):
-                            st.write(content)
-                    else:
-                        st.write(content)
-            else:
-                with st.chat_message("assistant"):
-                    st.markdown(content)
+    # The conversation is written into this container after the inputs below are read,
+    # so a new question and its answer show up without rerunning the app
+    chatContainer = st.container()
     
     # Chat input
-    user_question = st.chat_input("Ask the email marketing expert...")
-    
-    if user_question:
-        if st.session_state.gemini_model is None:
-            st.warning("⚠️ Please run the analysis first in 'Analysis Mode' to initialize the agent.")
-        else:
-            # Add user message to history
-            st.session_state.conversation_history.append({
-                'role': 'user',
-                'content': user_question
-            })
-            
-            # Display user message
-            with st.chat_message("user"):
-                st.write(user_question)
-            
-            # Get expert response
-            with st.chat_message("assistant"):
-                with st.spinner("Expert is thinking..."):
-                    try:
-                        response = chatWithEmailExpert(
-                            st.session_state.gemini_model,
-                            user_question,
-                            st.session_state.conversation_history[:-1],  # Exclude current message
-                            st.session_state.email_context
-                        )
-                        st.markdown(response)
-                        
-                        # Add assistant response to history
-                        st.session_state.conversation_history.append({
-                            'role': 'assistant',
-                            'content': response
-                        })
-                    except Exception as e:
-                        errorStr = str(e)
-                        if "429" in errorStr or "ResourceExhausted" in errorStr:
-                            if "GenerateRequestsPerDay" in errorStr or "free_tier_requests" in errorStr or "limit: 20" in errorStr:
-                                error_msg = """
-                                ⚠️ **Daily Limit Reached**
-                                
-                                You have reached the daily limit of 20 requests on the free tier.
-                                
-                                **You must wait until tomorrow** to continue using the service.
-                                """
-                            else:
-                                error_msg = f"Error: {str(e)}"
-                        else:
-                            error_msg = f"Error: {str(e)}"
-                        
-                        st.error(error_msg)
-                        st.session_state.conversation_history.append({
-                            'role': 'assistant',
-                            'content': error_msg
-                        })
+    st.chat_input("Ask the email marketing expert...", key="chat_question", on_submit=queueExpertRequest, args=('chat',), disabled=processing)
     
     # Quick question suggestions
     st.markdown("---")
     st.markdown("### 💡 Quick Questions")
-    col1, col2 = st.columns(2)
+    columns = st.columns(2)
     
-    def handleQuickQuestion(question):
-        """Handle quick question button click - add question and generate response."""
-        if st.session_state.gemini_model is None:
-            st.warning("⚠️ Please run the analysis first in 'Analysis Mode' to initialize the agent.")
-            return
-        
-        # Add user question to history
-        st.session_state.conversation_history.append({
-            'role': 'user',
-            'content': question
-        })
+    for index, (label, question) in enumerate(QUICK_QUESTIONS):
+        with columns[index % 2]:
+            st.button(label, use_container_width=True, key=f"q{index + 1}", on_click=queueExpertRequest, args=('quick', question), disabled=processing)
+    
+    user_question = requestQuestion if requestKind in ('chat', 'quick') else None
+    
+    with chatContainer:
+        # Display conversation history; older messages are only rendered on request
+        history = st.session_state.conversation_history
+        olderCount = len(history) - CHAT_HISTORY_WINDOW
+        if olderCount > 0 and st.toggle(f"Show {olderCount} earlier messages", key="show_older_messages"):
+            renderMessages(history[:olderCount])
+        renderMessages(history[-CHAT_HISTORY_WINDOW:])
         
-        # Generate expert response
-        try:
-            response = chatWithEmailExpert(
-                st.session_state.gemini_model,
-                question,
-                st.session_state.conversation_history[:-1],  # Exclude current message
-                st.session_state.email_context
-            )
-            
-            # Add assistant response to history
-            st.session_state.conversation_history.append({
-                'role': 'assistant',
-                'content': response
-            })
+        if user_question:
+            from src.agent import streamChatWithEmailExpert
             
-            st.rerun()
-        except Exception as e:
-            errorStr = str(e)
-            if "429" in errorStr or "ResourceExhausted" in errorStr:
-                if "GenerateRequestsPerDay" in errorStr or "free_tier_requests" in errorStr or "limit: 20" in errorStr:
-                    st.error("""
-                    ⚠️ **Daily Limit Reached**
-                    
-                    You have reached the daily limit of 20 requests.
-                    
-                    **You must wait until tomorrow** to continue.
-                    """)
-                else:
-                    st.error(f"Error: {str(e)}")
-            else:
-                st.error(f"Error: {str(e)}")
-    
-    with col1:
-        if st.button("How to improve open rates?", use_container_width=True, key="q1"):
-            handleQuickQuestion("How can I improve my open rates?")
+            requestInputs = getChatRequestInputs(user_question, history, st.session_state.email_context)
+            pendingExchange = (
+                user_question,
+                lambda: streamChatWithEmailExpert(getGeminiModel(), requestInputs['question'], requestInputs['history'], requestInputs['context'])
+            )
         
-        if st.button("What makes a good subject line?", use_container_width=True, key="q2"):
-            handleQuickQuestion("What makes a good subject line?")
+        if pendingExchange:
+            try:
+                runExpertExchange(*pendingExchange)
+            finally:
+                st.session_state.processing = False
     
-    with col2:
-        if st.button("How to reduce unsubscribes?", use_container_width=True, key="q3"):
-            handleQuickQuestion("How to reduce unsubscribe rates?")
-        
-        if st.button("Best practices for CTAs?", use_container_width=True, key="q4"):
-            handleQuickQuestion("Best practices for email CTAs?")
+    if processing:
+        # The inputs were rendered disabled for this exchange; rerun the panel to enable them again.
+        # A fragment-scoped rerun is not allowed while the panel runs as part of a full-app run
+        st.session_state.processing = False
+        if isFragmentRerun():
+            st.rerun(scope="fragment")
+
+@st.fragment
+def renderAnalysisResults():
+    """
+    Render the analysis report for the current session.
+    Runs as a fragment so the report is isolated from widget events elsewhere in the app.
+    """
+    if not st.session_state.analysis_results:
+        return
+    
+    # The cache timestamp is remembered for the session, so the cache is only consulted once per analysis;
+    # False means the analysis was computed in this session or there is no cache
+    if 'analysis_cached_at' not in st.session_state:
+        cachedAnalysis = loadCachedAnalysis()
+        st.session_state.analysis_cached_at = cachedAnalysis.get('timestamp', False) if cachedAnalysis else False
+    cachedAt = st.session_state.analysis_cached_at
+    if cachedAt:
+        formatted_time = formatCacheTimestamp(cachedAt)
+        st.caption(f"🗂️ Using cached analysis from {formatted_time}")
+    
+    st.markdown("---")
+    st.markdown("### 📄 Analysis Results")
+    st.html(renderMarkdownToHtml(st.session_state.analysis_results))
+    
+    st.info("💡 **Tip**: Switch to 'Interactive Chat' tab to ask questions about this analysis or get recommendations for specific emails.")
+
+# Main UI
+st.title("📧 Email Marketing Expert Agent")
+st.markdown("---")
+
+# Two main modes
+tab1, tab2 = st.tabs(["📊 Analysis Mode", "💬 Interactive Chat"])
+
+# TAB 1: Analysis Mode
+with tab1:
+    st.header("📊 Complete Email Analysis")
+    st.markdown("Click the button below to automatically analyze all emails from your database.")
+    
+    if st.button("🚀 Run Complete Analysis", use_container_width=True, type="primary", key="run_analysis"):
+        if runCompleteAnalysis():
+            st.success("✅ Analysis completed successfully!")
+            if CELEBRATE_ANALYSIS:
+                st.balloons()
+    
+    # Display analysis results
+    renderAnalysisResults()
+
+# TAB 2: Interactive Chat Mode
+with tab2:
+    st.header("💬 Interactive Chat with Email Expert")
+    
+    if st.session_state.analysis_results is None:
+        st.info("ℹ️ **Note**: Run the analysis first in the 'Analysis Mode' tab to get better context-aware responses.")
+    else:
+        st.success("✅ Analysis context loaded. The expert can reference your email performance data.")
+    
+    st.markdown("---")
+    
+    renderChatPanel()
     
     # Sidebar actions
     with st.sidebar:
         st.markdown("---")
-        if st.button("🗑️ Clear Chat History", use_container_width=True):
-            st.session_state.conversation_history = []
-            st.rerun()
+        st.button("🔄 Reload Email Data", use_container_width=True, on_click=loadEmailData.clear)
+        st.button("🗑️ Clear Chat History", use_container_width=True, on_click=clearChatHistory)
+
+# Warm the quick question answers after the page has rendered, so agent start-up does not delay it.
+# Only done once an analysis provides the context the answers depend on, and warmed answers
+# only match a conversation that has not started yet
+if WARM_QUICK_QUESTIONS and st.session_state.email_context and not st.session_state.conversation_history:
+    startQuickQuestionWarmup(st.session_state.email_context)
 
 if __name__ == "__main__":
     pass
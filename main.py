@@ -3,7 +3,7 @@ import sys
 import io
 from src.database import getEmailMessages
 from src.processor import processEmailData, getTopPerformingEmails, getWorstPerformingEmails, prepareEmailDataForAnalysis
-from src.agent import initializeGeminiAgent, analyzeEmailBatch
+from src.agent import getSharedModel, analyzeEmailBatch
 
 # Configure stdout to handle Unicode characters (emojis, etc.)
 if sys.platform == 'win32':
@@ -35,11 +35,11 @@ def main():
         
         # Step 2: Initialize Gemini agent
         logger.info("Step 2: Initializing Gemini agent")
-        geminiModel = initializeGeminiAgent()
+        geminiModel = getSharedModel()
         
         # Step 3: Analyze email batch with Gemini
         logger.info("Step 3: Analyzing emails with Gemini AI")
-        analysisResults = analyzeEmailBatch(processedEmails, geminiModel, batchSize=3)
+        analysisResults = analyzeEmailBatch(processedEmails, geminiModel)
         
         # Step 4: Display results
         logger.info("Step 4: Analysis complete")
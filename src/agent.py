@@ -1,19 +1,313 @@
 import os
+import io
+import json
 import logging
 import time
 import re
-import google.generativeai as genai
-import google.api_core.exceptions as gcp_exceptions
+import asyncio
+import functools
+import threading
+import numpy as np
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
+
+from src.llm_cache import cachedGenerate, cachedGenerateAsync, cachedGenerateStream, IncompleteResponseError
+from src.text_cleaning import cleanEmailText
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Retry delay suggested by the API in quota errors, e.g. "Please retry in 12.5s"
+RETRY_DELAY_PATTERN = re.compile(r'retry in ([\d.]+)s', re.IGNORECASE)
+
+# Quota ID of a daily limit in quota errors, e.g. "GenerateRequestsPerDayPerProjectPerModel-FreeTier"
+DAILY_QUOTA_PATTERN = re.compile(r'PerDay')
+
+# Model used when the available models cannot be listed. GenerativeModel does not contact the API,
+# so an unavailable fallback only shows up on the first request
+FALLBACK_MODEL_NAME = 'gemini-1.5-flash'
+
+# Per-email section header in batched improvement responses, e.g. "### [2] ###"
+IMPROVEMENT_SECTION_PATTERN = re.compile(r'^### \[(\d+)\] ###[ \t]*$', re.MULTILINE)
+
+# Generation settings per request type. No output cap is set: on thinking models the thinking
+# tokens count against max_output_tokens, so a tight cap can leave no room for the answer
+BATCH_GENERATION_CONFIG = {'temperature': 0.3}
+FINAL_GENERATION_CONFIG = {'temperature': 0.3}
+IMPROVEMENT_GENERATION_CONFIG = {'temperature': 0.4}
+
+# Output size the rate limiter reserves for a batch or condense request without an output cap
+BATCH_OUTPUT_TOKEN_ESTIMATE = 1024
+
+# Longest email body passed to the batch analysis, in characters
+PROMPT_BODY_CHAR_LIMIT = 2000
+
+# Estimated tokens of email data packed into each batch prompt
+BATCH_PROMPT_TOKEN_BUDGET = 6000
+
+# Batch analyses are condensed in groups of this size until they fit the final prompt budget
+ANALYSIS_REDUCE_GROUP_SIZE = 8
+FINAL_PROMPT_TOKEN_BUDGET = 32000
+
+# Labels for the analyses collected into the reduce and final prompts
+BATCH_ANALYSIS_TEMPLATE = "\n--- BATCH {number} ANALYSIS ---\n{analysis}\n"
+COMBINED_ANALYSIS_TEMPLATE = "\n--- COMBINED ANALYSIS {number} ---\n{analysis}\n"
+
+class RequestRateLimiter:
+    """
+    Async limiter that paces requests to stay under requests-per-minute and tokens-per-minute quotas.
+    Requests are released at most once every 60 / requestsPerMinute seconds, and draw their
+    estimated tokens from a bucket that refills at tokensPerMinute / 60 tokens per second.
+    Waiting happens before dispatch, so bursts never run into the quota in the first place.
+    """
+    
+    def __init__(self, requestsPerMinute, tokensPerMinute=None):
+        self.interval = 60.0 / requestsPerMinute
+        self.nextSlot = 0.0
+        self.tokensPerMinute = tokensPerMinute
+        self.availableTokens = float(tokensPerMinute or 0)
+        self.lastRefill = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self, tokens=0):
+        """
+        Wait until a request carrying the given number of tokens can be sent.
+        
+        Args:
+            tokens: Estimated tokens (input and output) of the request
+        """
+        async with self.lock:
+            now = time.monotonic()
+            dispatchAt = max(now, self.nextSlot)
+            
+            if self.tokensPerMinute:
+                tokenRate = self.tokensPerMinute / 60.0
+                self.availableTokens = min(self.tokensPerMinute, self.availableTokens + (now - self.lastRefill) * tokenRate)
+                self.lastRefill = now
+                
+                # A shortfall is borrowed from future refills, so later requests queue behind this one
+                self.availableTokens -= min(tokens, self.tokensPerMinute)
+                if self.availableTokens < 0:
+                    dispatchAt = max(dispatchAt, now - self.availableTokens / tokenRate)
+            
+            self.nextSlot = dispatchAt + self.interval
+            waitTime = dispatchAt - now
+        
+        if waitTime > 0:
+            await asyncio.sleep(waitTime)
+    
+    def pause(self, delay):
+        """
+        Hold back further requests after a quota error, honoring the API's suggested retry delay.
+        
+        Args:
+            delay: Seconds before the next request may be sent
+        """
+        self.nextSlot = max(self.nextSlot, time.monotonic() + delay)
+
+def getRetryDelay(error, defaultDelay):
+    """
+    Get the delay before retrying a quota error, preferring the delay suggested by the API.
+    The structured RetryInfo detail is used when the error carries one; the error message
+    is only parsed as a fallback.
+    
+    Args:
+        error: ResourceExhausted error raised by the API
+        defaultDelay: Delay to use when the error does not suggest one
+    
+    Returns:
+        Delay in seconds
+    """
+    from google.rpc import error_details_pb2
+    
+    for detail in getattr(error, 'details', None) or []:
+        if isinstance(detail, error_details_pb2.RetryInfo) and detail.HasField('retry_delay'):
+            return detail.retry_delay.seconds + detail.retry_delay.nanos / 1e9 + 2
+    
+    match = RETRY_DELAY_PATTERN.search(str(error))
+    if match:
+        return float(match.group(1)) + 2
+    return defaultDelay
+
+def getQuotaRetryDelay(error, attempt, maxRetries, retryDelay, description):
+    """
+    Handle a quota error for one attempt: get the delay before the next attempt,
+    or re-raise the error once all attempts are used up.
+    Shared by generateWithRetry and generateWithRetryAsync.
+    
+    Args:
+        error: ResourceExhausted error raised by the API
+        attempt: Zero-based number of the failed attempt
+        maxRetries: Maximum number of attempts
+        retryDelay: Current backoff delay in seconds
+        description: What is being generated (for logging)
+    
+    Returns:
+        Delay in seconds before the next attempt
+    """
+    if attempt >= maxRetries - 1:
+        logger.error(f"Failed after {maxRetries} retries for {description}")
+        raise error
+    retryDelay = getRetryDelay(error, retryDelay)
+    logger.warning(f"Quota exceeded. Waiting {retryDelay:.1f} seconds before retry {attempt + 1}/{maxRetries}")
+    return retryDelay
+
+def getUncappedRetryConfig(error, attempt, maxRetries, generationConfig, description):
+    """
+    Handle a response without text for one attempt: if the output token cap ran out, get the
+    config to ask again without the cap; otherwise, or once all attempts are used up, re-raise.
+    Shared by generateWithRetry and generateWithRetryAsync.
+    
+    Args:
+        error: IncompleteResponseError for the failed attempt
+        attempt: Zero-based number of the failed attempt
+        maxRetries: Maximum number of attempts
+        generationConfig: Generation config dict of the failed attempt
+        description: What is being generated (for logging)
+    
+    Returns:
+        Generation config dict for the next attempt
+    """
+    if error.finishReason != 'MAX_TOKENS' or not generationConfig or 'max_output_tokens' not in generationConfig or attempt >= maxRetries - 1:
+        logger.error(f"No response text for {description}: {str(error)}")
+        raise error
+    logger.warning(f"Output token cap reached before any text for {description}, asking again without the cap")
+    return {key: value for key, value in generationConfig.items() if key != 'max_output_tokens'}
+
+def generateWithRetry(model, prompt, description, maxRetries=3, initialDelay=20, chunkCallback=None, generationConfig=None):
+    """
+    Generate a response, retrying with a growing delay on quota errors.
+    A response cut off by the output token cap before any text is asked again without the cap.
+    
+    Args:
+        model: Initialized Gemini model
+        prompt: Prompt string
+        description: What is being generated (for logging)
+        maxRetries: Maximum number of attempts (default: 3)
+        initialDelay: Delay in seconds before the first retry (default: 20)
+        chunkCallback: Optional callable(text) to stream the response to as it is generated
+        generationConfig: Optional generation config dict (output token cap, temperature)
+    
+    Returns:
+        Response text
+    """
+    # Imported here so loading this module does not pull in the API client
+    import google.api_core.exceptions as gcp_exceptions
+    
+    retryDelay = initialDelay
+    
+    for attempt in range(maxRetries):
+        try:
+            return cachedGenerate(model, prompt, chunkCallback=chunkCallback, generationConfig=generationConfig)
+        except IncompleteResponseError as e:
+            generationConfig = getUncappedRetryConfig(e, attempt, maxRetries, generationConfig, description)
+        except gcp_exceptions.ResourceExhausted as e:
+            retryDelay = getQuotaRetryDelay(e, attempt, maxRetries, retryDelay, description)
+            time.sleep(retryDelay)
+            retryDelay *= 1.5
+
+async def generateWithRetryAsync(model, prompt, description, maxRetries=3, initialDelay=20, generationConfig=None, limiter=None):
+    """
+    Async variant of generateWithRetry, waiting between retries without blocking the event loop.
+    
+    Args:
+        model: Initialized Gemini model
+        prompt: Prompt string
+        description: What is being generated (for logging)
+        maxRetries: Maximum number of attempts (default: 3)
+        initialDelay: Delay in seconds before the first retry (default: 20)
+        generationConfig: Optional generation config dict (output token cap, temperature)
+        limiter: Optional RequestRateLimiter shared with other requests, paused on quota errors
+            so they do not run into the same limit
+    
+    Returns:
+        Response text
+    """
+    # Imported here so loading this module does not pull in the API client
+    import google.api_core.exceptions as gcp_exceptions
+    
+    retryDelay = initialDelay
+    
+    for attempt in range(maxRetries):
+        try:
+            return await cachedGenerateAsync(model, prompt, generationConfig=generationConfig)
+        except IncompleteResponseError as e:
+            generationConfig = getUncappedRetryConfig(e, attempt, maxRetries, generationConfig, description)
+        except gcp_exceptions.ResourceExhausted as e:
+            retryDelay = getQuotaRetryDelay(e, attempt, maxRetries, retryDelay, description)
+            if limiter:
+                limiter.pause(retryDelay)
+            await asyncio.sleep(retryDelay)
+            retryDelay *= 1.5
+
+def generateStreamWithRetry(model, prompt, description, maxRetries=3, initialDelay=20, generationConfig=None):
+    """
+    Streaming variant of generateWithRetry: start a streamed (and cached) response, retrying with
+    a growing delay on per-minute quota errors. The SDK fetches the first chunk before returning, so quota
+    errors surface here rather than while the stream is read. A daily quota error is raised
+    at once, since no retry can succeed before the quota resets.
+    
+    Args:
+        model: Initialized Gemini model
+        prompt: Prompt string
+        description: What is being generated (for logging)
+        maxRetries: Maximum number of attempts (default: 3)
+        initialDelay: Delay in seconds before the first retry (default: 20)
+        generationConfig: Optional generation config dict (output token cap, temperature)
+    
+    Returns:
+        Iterator over response text chunks
+    """
+    # Imported here so loading this module does not pull in the API client
+    import google.api_core.exceptions as gcp_exceptions
+    
+    retryDelay = initialDelay
+    
+    for attempt in range(maxRetries):
+        try:
+            return cachedGenerateStream(model, prompt, generationConfig=generationConfig)
+        except gcp_exceptions.ResourceExhausted as e:
+            if DAILY_QUOTA_PATTERN.search(str(e)):
+                logger.error(f"Daily quota exhausted for {description}")
+                raise
+            retryDelay = getQuotaRetryDelay(e, attempt, maxRetries, retryDelay, description)
+            time.sleep(retryDelay)
+            retryDelay *= 1.5
+
+def listGenerationModels(retryDelay=1):
+    """
+    List the names of models that support generateContent.
+    A transient listing failure (503 or deadline) is retried once before being raised.
+    
+    Args:
+        retryDelay: Seconds to wait before the retry (default: 1)
+    
+    Returns:
+        List of full model names, e.g. 'models/gemini-2.5-flash'
+    """
+    import google.generativeai as genai
+    import google.api_core.exceptions as gcp_exceptions
+    
+    try:
+        models = genai.list_models()
+        return [m.name for m in models if 'generateContent' in m.supported_generation_methods]
+    except (gcp_exceptions.ServiceUnavailable, gcp_exceptions.DeadlineExceeded) as e:
+        logger.warning(f"Listing models failed, retrying in {retryDelay} seconds: {str(e)}")
+        time.sleep(retryDelay)
+        models = genai.list_models()
+        return [m.name for m in models if 'generateContent' in m.supported_generation_methods]
+
+@functools.lru_cache(maxsize=1)
 def initializeGeminiAgent():
     """
     Initialize Gemini API with API key from environment variables.
     Returns configured Gemini model for email analysis.
+    The model is created once per process, so list_models is only called on first use.
     """
     apiKey = os.getenv("GEMINI_API_KEY")
     
@@ -21,22 +315,28 @@ def initializeGeminiAgent():
         logger.error("GEMINI_API_KEY environment variable is not set")
         raise ValueError("GEMINI_API_KEY must be set in environment variables")
     
+    # The SDK (with grpc and protobuf) is imported on first use rather than when this module loads
+    import google.generativeai as genai
+    import google.api_core.exceptions as gcp_exceptions
+    
     try:
+        # No transport is forced: the default gRPC transport keeps one persistent channel per client,
+        # and passing transport= would also hand the sync transport to the SDK's async client
         genai.configure(api_key=apiKey)
         
         # Try to list available models to find a compatible one
         try:
-            models = genai.list_models()
-            availableModels = [m.name for m in models if 'generateContent' in m.supported_generation_methods]
+            availableModels = listGenerationModels()
             logger.info(f"Available models: {availableModels}")
             
             # Try preferred models in order (using full model names from the list)
             preferredModelNames = ['gemini-2.5-flash', 'gemini-2.5-pro', 'gemini-pro-latest', 'gemini-flash-latest']
             modelName = None
             
+            availableModelSet = set(availableModels)
             for preferred in preferredModelNames:
                 fullModelName = f'models/{preferred}'
-                if fullModelName in availableModels:
+                if fullModelName in availableModelSet:
                     modelName = preferred  # Use short name for GenerativeModel
                     break
             
@@ -50,35 +350,35 @@ def initializeGeminiAgent():
             
             model = genai.GenerativeModel(modelName)
             logger.info(f"Gemini agent initialized successfully with model: {modelName}")
-        except Exception as listError:
-            # Fallback: try common model names
-            logger.warning(f"Could not list models, trying fallback: {str(listError)}")
-            try:
-                model = genai.GenerativeModel('gemini-1.5-flash')
-                logger.info("Gemini agent initialized with gemini-1.5-flash")
-            except:
-                model = genai.GenerativeModel('gemini-pro')
-                logger.info("Gemini agent initialized with gemini-pro")
+        except (gcp_exceptions.ServiceUnavailable, gcp_exceptions.DeadlineExceeded, ValueError) as listError:
+            # Fallback: use a common model name. Configuration errors such as an invalid
+            # API key are not caught here, since no fallback model would work either
+            logger.warning(f"Could not list models, using fallback model: {str(listError)}")
+            model = genai.GenerativeModel(FALLBACK_MODEL_NAME)
+            logger.info(f"Gemini agent initialized with {FALLBACK_MODEL_NAME}")
         
         return model
     except Exception as e:
         logger.error(f"Failed to initialize Gemini agent: {str(e)}")
         raise
 
-def analyzeEmailEffectiveness(emailData, model):
+# Guards the first initialization of the shared model
+sharedModelLock = threading.Lock()
+
+def getSharedModel():
     """
-    Analyze email effectiveness using Gemini AI.
-    Analyzes email content and metrics to identify what makes emails more effective.
-    
-    Args:
-        emailData: Dictionary or string containing email information and metrics
-        model: Initialized Gemini model
+    Get the Gemini model shared by the whole process.
+    Callers should use this rather than initializing their own model, so every request
+    reuses the same client and its open connection.
     
     Returns:
-        Analysis results from Gemini
+        Initialized Gemini model
     """
-    try:
-        prompt = f"""
+    with sharedModelLock:
+        return initializeGeminiAgent()
+
+# Prompt for analyzeEmailEffectiveness
+EFFECTIVENESS_PROMPT_TEMPLATE = """
 You are an expert email marketing analyst. Analyze the following email data and identify what elements contribute to higher email effectiveness.
 
 Email Data:
@@ -92,56 +392,234 @@ Based on the metrics provided (sent, opened, clicked, unsubscribed), analyze:
 
 Provide a detailed analysis with specific recommendations.
 """
+
+def serializePromptData(data):
+    """
+    Serialize structured email data to compact JSON for a prompt, using orjson when it is installed.
+    Compact JSON is far shorter than the Python repr of the same records, so prompts cost fewer tokens.
+    Values JSON has no type for (timestamps, numpy scalars) are written as strings or numbers.
+    
+    Args:
+        data: Records (e.g. from prepareEmailDataForAnalysis) or any JSON-like object
+    
+    Returns:
+        JSON string
+    """
+    if orjson:
+        return orjson.dumps(data, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False, default=str)
+
+def analyzeEmailEffectiveness(emailData, model):
+    """
+    Analyze email effectiveness using Gemini AI.
+    Analyzes email content and metrics to identify what makes emails more effective.
+    
+    Args:
+        emailData: Dictionary or string containing email information and metrics
+        model: Initialized Gemini model
+    
+    Returns:
+        Analysis results from Gemini
+    """
+    try:
+        if not isinstance(emailData, str):
+            emailData = serializePromptData(emailData)
+        prompt = EFFECTIVENESS_PROMPT_TEMPLATE.format(emailData=emailData)
         
-        response = model.generate_content(prompt)
+        response = cachedGenerate(model, prompt)
         logger.info("Email effectiveness analysis completed")
-        return response.text
+        return response
     except Exception as e:
         logger.error(f"Failed to analyze email effectiveness: {str(e)}")
         raise
 
-def analyzeEmailBatch(emailDataFrame, model, batchSize=3):
+async def generateBatchAnalysis(model, prompt, batchNum, generationConfig=BATCH_GENERATION_CONFIG, limiter=None):
     """
-    Analyze all emails in batches to identify patterns and best practices.
-    Processes all emails in small groups to stay within API limits.
+    Generate the analysis for a single batch prompt, retrying on quota errors.
+    The request runs in a worker thread, so batches overlap while waiting on the network.
+    A batch for which Gemini returns no text is skipped rather than failing the whole analysis.
     
     Args:
-        emailDataFrame: pandas DataFrame with email data
         model: Initialized Gemini model
-        batchSize: Number of emails to analyze per batch (default: 3)
+        prompt: Batch analysis prompt
+        batchNum: Batch number (for logging)
+        generationConfig: Generation config dict (default: BATCH_GENERATION_CONFIG)
+        limiter: Optional RequestRateLimiter to pause on quota errors
     
     Returns:
-        Comprehensive analysis of email patterns
+        Batch analysis text, or an empty string if the batch produced no text
     """
     try:
-        # Calculate effectiveness metrics for each email
-        emailDataFrame['openRate'] = (emailDataFrame['mcopened'] / emailDataFrame['mcsent'] * 100).fillna(0)
-        emailDataFrame['clickRate'] = (emailDataFrame['mcclicked'] / emailDataFrame['mcsent'] * 100).fillna(0)
-        emailDataFrame['unsubRate'] = (emailDataFrame['mcunsub'] / emailDataFrame['mcsent'] * 100).fillna(0)
+        return await generateWithRetryAsync(model, prompt, f"batch {batchNum}", generationConfig=generationConfig, limiter=limiter)
+    except IncompleteResponseError as e:
+        logger.warning(f"Skipping batch {batchNum}: {str(e)}")
+        return ''
+    except Exception as e:
+        logger.error(f"Failed to analyze batch {batchNum}: {str(e)}")
+        raise
+
+async def runBatchPrompts(model, prompts, maxConcurrency, requestsPerMinute, tokensPerMinute=None, progressCallback=None, generationConfig=BATCH_GENERATION_CONFIG):
+    """
+    Run batch prompts concurrently, capped by a semaphore and a rate limiter.
+    Retries with backoff remain as a fallback for quota errors the limiter does not prevent.
+    
+    Args:
+        model: Initialized Gemini model
+        prompts: List of batch prompts, in batch order
+        maxConcurrency: Maximum number of requests in flight
+        requestsPerMinute: Maximum request rate
+        tokensPerMinute: Optional maximum token rate
+        progressCallback: Optional callable(completed, total) invoked as batches finish
+        generationConfig: Generation config dict (default: BATCH_GENERATION_CONFIG)
+    
+    Returns:
+        List of batch analysis texts, in the same order as prompts
+    """
+    semaphore = asyncio.Semaphore(maxConcurrency)
+    limiter = RequestRateLimiter(requestsPerMinute, tokensPerMinute)
+    totalBatches = len(prompts)
+    completed = 0
+    
+    async def runOne(batchNum, prompt):
+        nonlocal completed
+        async with semaphore:
+            await limiter.acquire(estimateTokenCount(prompt) + generationConfig.get('max_output_tokens', BATCH_OUTPUT_TOKEN_ESTIMATE))
+            logger.info(f"Analyzing batch {batchNum}/{totalBatches}")
+            result = await generateBatchAnalysis(model, prompt, batchNum, generationConfig, limiter)
         
-        # Sort by effectiveness score for better analysis
-        emailDataFrame['effectivenessScore'] = (
-            emailDataFrame['openRate'] * 0.4 + 
-            emailDataFrame['clickRate'] * 0.5 - 
-            emailDataFrame['unsubRate'] * 0.1
+        completed += 1
+        if progressCallback:
+            progressCallback(completed, totalBatches)
+        return result
+    
+    return await asyncio.gather(*[runOne(batchNum, prompt) for batchNum, prompt in enumerate(prompts, start=1)])
+
+def formatEmailEntries(emailDataFrame, metrics, order):
+    """
+    Format each email compactly for the batch analysis prompt.
+    Only the fields the analysis needs are written, and bodies are truncated to PROMPT_BODY_CHAR_LIMIT.
+    
+    Args:
+        emailDataFrame: DataFrame with email content
+        metrics: Dict of per-row metric arrays (openRate, clickRate, unsubRate, effectivenessScore)
+        order: Row positions to format, in the order they should appear
+    
+    Returns:
+        List of formatted email strings, following order
+    """
+    entries = []
+    subjects = emailDataFrame['subject'].to_numpy()
+    plaintexts = emailDataFrame['plaintext'].to_numpy()
+    messageBodies = emailDataFrame['message_body'].to_numpy()
+    openRates = metrics['openRate']
+    clickRates = metrics['clickRate']
+    unsubRates = metrics['unsubRate']
+    scores = metrics['effectivenessScore']
+    for position in order:
+        # The plaintext version carries the same copy as the HTML body with far fewer tokens;
+        # either is reduced to readable text before truncation
+        body = cleanEmailText(plaintexts[position], PROMPT_BODY_CHAR_LIMIT) or cleanEmailText(messageBodies[position], PROMPT_BODY_CHAR_LIMIT)
+        entries.append(
+            f"Subject: {subjects[position]}\n"
+            f"Open: {openRates[position]:.1f}% | Click: {clickRates[position]:.1f}% | Unsub: {unsubRates[position]:.1f}% | Score: {scores[position]:.1f}\n"
+            f"Body: {body}\n\n"
         )
-        emailDataFrame = emailDataFrame.sort_values('effectivenessScore', ascending=False)
+    return entries
+
+def packEmailBatches(entries, tokenBudget=BATCH_PROMPT_TOKEN_BUDGET, maxBatchSize=None):
+    """
+    Group formatted emails into batches by estimated token count instead of a fixed size.
+    Emails are added to a batch until the next one would exceed the budget; an email larger
+    than the budget gets a batch of its own.
+    
+    Args:
+        entries: List of formatted email strings from formatEmailEntries
+        tokenBudget: Estimated tokens of email data per batch
+        maxBatchSize: Optional maximum number of emails per batch
+    
+    Returns:
+        List of batches, each a list of formatted email strings
+    """
+    batches = []
+    currentBatch = []
+    currentTokens = 0
+    for entry in entries:
+        entryTokens = estimateTokenCount(entry)
+        batchFull = maxBatchSize is not None and len(currentBatch) >= maxBatchSize
+        if currentBatch and (batchFull or currentTokens + entryTokens > tokenBudget):
+            batches.append(currentBatch)
+            currentBatch = []
+            currentTokens = 0
+        currentBatch.append(entry)
+        currentTokens += entryTokens
+    if currentBatch:
+        batches.append(currentBatch)
+    return batches
+
+def formatBatchEmails(batchEntries):
+    """
+    Number the formatted emails of one batch for the batch analysis prompt.
+    
+    Args:
+        batchEntries: List of formatted email strings
+    
+    Returns:
+        Formatted batch string
+    """
+    buffer = io.StringIO()
+    for index, entry in enumerate(batchEntries, start=1):
+        buffer.write(f"[{index}] ")
+        buffer.write(entry)
+    return buffer.getvalue()
+
+# Prompt condensing a group of batch analyses
+REDUCE_PROMPT_TEMPLATE = """
+You are an expert email marketing analyst. Condense the following batch analyses into a single analysis,
+keeping every distinct pattern, best practice, mistake and recommendation they identify.
+
+BATCH ANALYSES:
+{analyses}
+
+Provide a concise combined analysis focusing on actionable insights.
+"""
+
+def reduceBatchAnalyses(model, analyses, maxConcurrency, requestsPerMinute, tokensPerMinute=None):
+    """
+    Condense batch analyses until they fit the final prompt budget.
+    Each round summarizes groups of ANALYSIS_REDUCE_GROUP_SIZE analyses, so the final prompt
+    stays bounded however many emails were analyzed.
+    
+    Args:
+        model: Initialized Gemini model
+        analyses: List of labelled batch analysis texts
+        maxConcurrency: Maximum number of requests in flight
+        requestsPerMinute: Maximum request rate
+        tokensPerMinute: Optional maximum token rate
+    
+    Returns:
+        List of labelled analysis texts that fits the final prompt budget
+    """
+    # Sized from the parts, so the combined text is only built once it is actually used
+    while len(analyses) > 1 and sum(estimateTokenCount(analysis) for analysis in analyses) > FINAL_PROMPT_TOKEN_BUDGET:
+        groups = [analyses[i:i+ANALYSIS_REDUCE_GROUP_SIZE] for i in range(0, len(analyses), ANALYSIS_REDUCE_GROUP_SIZE)]
+        logger.info(f"Condensing {len(analyses)} analyses into {len(groups)} summaries")
         
-        # Split emails into batches
-        totalEmails = len(emailDataFrame)
-        allAnalyses = []
+        reducePrompts = [REDUCE_PROMPT_TEMPLATE.format(analyses=''.join(group)) for group in groups]
         
-        for i in range(0, totalEmails, batchSize):
-            batch = emailDataFrame.iloc[i:i+batchSize]
-            batchNum = (i // batchSize) + 1
-            totalBatches = (totalEmails + batchSize - 1) // batchSize
-            
-            logger.info(f"Analyzing batch {batchNum}/{totalBatches} ({len(batch)} emails)")
-            
-            # Prepare data for this batch
-            batchData = batch[['subject', 'plaintext', 'message_body', 'openRate', 'clickRate', 'unsubRate', 'effectivenessScore']].to_dict('records')
-            
-            prompt = f"""
+        summaries = asyncio.run(runBatchPrompts(model, reducePrompts, maxConcurrency, requestsPerMinute, tokensPerMinute))
+        if not any(summaries):
+            logger.warning("No analyses could be condensed, using them as they are")
+            break
+        analyses = [
+            COMBINED_ANALYSIS_TEMPLATE.format(number=summaryNum, analysis=summaryText)
+            for summaryNum, summaryText in enumerate(summaries, start=1)
+            if summaryText
+        ]
+    
+    return analyses
+
+# Prompts for the batch and final steps of analyzeEmailBatch
+BATCH_PROMPT_TEMPLATE = """
 You are an expert email marketing analyst. Analyze the following email batch to identify what makes emails effective.
 
 EMAIL BATCH {batchNum} of {totalBatches}:
@@ -155,49 +633,12 @@ For this batch, analyze:
 
 Provide a concise analysis focusing on actionable insights.
 """
-            
-            # Retry logic for quota errors
-            maxRetries = 3
-            retryDelay = 20
-            
-            for attempt in range(maxRetries):
-                try:
-                    response = model.generate_content(prompt)
-                    allAnalyses.append(f"\n--- BATCH {batchNum} ANALYSIS ---\n{response.text}\n")
-                    break
-                except gcp_exceptions.ResourceExhausted as e:
-                    if attempt < maxRetries - 1:
-                        errorStr = str(e)
-                        if "retry in" in errorStr.lower():
-                            try:
-                                match = re.search(r'retry in ([\d.]+)s', errorStr, re.IGNORECASE)
-                                if match:
-                                    retryDelay = float(match.group(1)) + 2
-                            except:
-                                pass
-                        
-                        logger.warning(f"Quota exceeded. Waiting {retryDelay:.1f} seconds before retry {attempt + 1}/{maxRetries}")
-                        time.sleep(retryDelay)
-                        retryDelay *= 1.5
-                    else:
-                        logger.error(f"Failed after {maxRetries} retries for batch {batchNum}")
-                        raise
-                except Exception as e:
-                    logger.error(f"Failed to analyze batch {batchNum}: {str(e)}")
-                    raise
-            
-            # Small delay between batches to avoid hitting rate limits
-            if i + batchSize < totalEmails:
-                time.sleep(2)
-        
-        # Final comprehensive analysis combining all batches
-        logger.info("Generating comprehensive analysis from all batches")
-        
-        finalPrompt = f"""
+
+FINAL_PROMPT_TEMPLATE = """
 You are an expert email marketing analyst. Based on the following batch analyses, provide a comprehensive summary identifying:
 
 BATCH ANALYSES:
-{''.join(allAnalyses)}
+{analyses}
 
 Provide a final comprehensive analysis with:
 1. Overall patterns across all emails
@@ -208,50 +649,90 @@ Provide a final comprehensive analysis with:
 
 Provide a clear, actionable summary.
 """
-        
-        # Retry for final analysis
-        maxRetries = 3
-        retryDelay = 20
-        
-        for attempt in range(maxRetries):
-            try:
-                finalResponse = model.generate_content(finalPrompt)
-                logger.info(f"Batch analysis completed for {totalEmails} emails")
-                return finalResponse.text
-            except gcp_exceptions.ResourceExhausted as e:
-                if attempt < maxRetries - 1:
-                    errorStr = str(e)
-                    if "retry in" in errorStr.lower():
-                        try:
-                            match = re.search(r'retry in ([\d.]+)s', errorStr, re.IGNORECASE)
-                            if match:
-                                retryDelay = float(match.group(1)) + 2
-                        except:
-                            pass
-                    
-                    logger.warning(f"Quota exceeded. Waiting {retryDelay:.1f} seconds before retry {attempt + 1}/{maxRetries}")
-                    time.sleep(retryDelay)
-                    retryDelay *= 1.5
-                else:
-                    logger.error(f"Failed after {maxRetries} retries for final analysis")
-                    raise
-        
-    except Exception as e:
-        logger.error(f"Failed to analyze email batch: {str(e)}")
-        raise
 
-def getEmailMarketingExpertSystemPrompt(emailDataContext=None):
+def analyzeEmailBatch(emailDataFrame, model, batchSize=None, batchTokenBudget=BATCH_PROMPT_TOKEN_BUDGET, maxConcurrency=4, requestsPerMinute=15, tokensPerMinute=250000, progressCallback=None, finalChunkCallback=None,
+                      batchGenerationConfig=BATCH_GENERATION_CONFIG, finalGenerationConfig=FINAL_GENERATION_CONFIG):
     """
-    Get the expert system prompt for email marketing consultation.
-    Includes comprehensive knowledge about email marketing best practices.
+    Analyze all emails in batches to identify patterns and best practices.
+    Batches are sent to Gemini concurrently while staying within API rate limits.
     
     Args:
-        emailDataContext: Optional context from analyzed emails
+        emailDataFrame: pandas DataFrame with email data
+        model: Initialized Gemini model
+        batchSize: Optional maximum number of emails per batch (default: no limit)
+        batchTokenBudget: Estimated tokens of email data packed into each batch (default: BATCH_PROMPT_TOKEN_BUDGET)
+        maxConcurrency: Maximum number of batch requests in flight (default: 4)
+        requestsPerMinute: Request rate cap, matching the free tier (default: 15)
+        tokensPerMinute: Token rate cap, matching the free tier (default: 250000)
+        progressCallback: Optional callable(completed, total) invoked as batches finish
+        finalChunkCallback: Optional callable(text) receiving the final analysis as it streams in
+        batchGenerationConfig: Generation config dict for batch requests (default: BATCH_GENERATION_CONFIG)
+        finalGenerationConfig: Generation config dict for the final summary (default: FINAL_GENERATION_CONFIG)
     
     Returns:
-        System prompt string
+        Comprehensive analysis of email patterns
     """
-    basePrompt = """You are an expert email marketing consultant with deep expertise in:
+    try:
+        # Reuse the metrics processEmailData already calculated; otherwise calculate them in one
+        # pass per rate, kept in local arrays so the caller's DataFrame is not modified.
+        # Emails without sends get a rate of 0 instead of dividing by zero
+        metricColumns = ['openRate', 'clickRate', 'unsubRate', 'effectivenessScore']
+        if all(column in emailDataFrame.columns for column in metricColumns):
+            metrics = {column: emailDataFrame[column].to_numpy(dtype=np.float64) for column in metricColumns}
+        else:
+            sent = emailDataFrame['mcsent'].to_numpy(dtype=np.float64)
+            hasSends = sent > 0
+            metrics = {}
+            for sourceColumn, rateColumn in [('mcopened', 'openRate'), ('mcclicked', 'clickRate'), ('mcunsub', 'unsubRate')]:
+                rate = np.zeros_like(sent)
+                np.divide(np.nan_to_num(emailDataFrame[sourceColumn].to_numpy(dtype=np.float64)), sent, out=rate, where=hasSends)
+                rate *= 100.0
+                metrics[rateColumn] = rate
+            metrics['effectivenessScore'] = metrics['openRate'] * 0.4 + metrics['clickRate'] * 0.5 - metrics['unsubRate'] * 0.1
+        
+        # Order rows by effectiveness score for better analysis, without copying the DataFrame
+        order = np.argsort(-metrics['effectivenessScore'], kind='stable')
+        
+        # Duplicate rows (e.g. from joins) carry no extra information, so each email is analyzed once
+        duplicated = emailDataFrame.duplicated(subset=['subject', 'plaintext', 'message_body', 'mcsent', 'mcopened', 'mcclicked', 'mcunsub']).to_numpy()
+        if duplicated.any():
+            logger.info(f"Skipping {int(duplicated.sum())} duplicate emails")
+            order = order[~duplicated[order]]
+        
+        # Pack emails into batches by estimated prompt size
+        totalEmails = len(order)
+        batches = packEmailBatches(formatEmailEntries(emailDataFrame, metrics, order), batchTokenBudget, batchSize)
+        totalBatches = len(batches)
+        batchPrompts = [
+            BATCH_PROMPT_TEMPLATE.format(batchNum=batchNum, totalBatches=totalBatches, batchData=formatBatchEmails(batchEntries))
+            for batchNum, batchEntries in enumerate(batches, start=1)
+        ]
+        
+        logger.info(f"Analyzing {totalEmails} emails in {totalBatches} batches (up to {maxConcurrency} concurrent)")
+        batchResults = asyncio.run(runBatchPrompts(model, batchPrompts, maxConcurrency, requestsPerMinute, tokensPerMinute, progressCallback, batchGenerationConfig))
+        allAnalyses = [
+            BATCH_ANALYSIS_TEMPLATE.format(number=batchNum, analysis=batchText)
+            for batchNum, batchText in enumerate(batchResults, start=1)
+            if batchText
+        ]
+        if not allAnalyses:
+            raise ValueError("No batch produced an analysis")
+        allAnalyses = reduceBatchAnalyses(model, allAnalyses, maxConcurrency, requestsPerMinute, tokensPerMinute)
+        
+        # Final comprehensive analysis combining all batches
+        logger.info("Generating comprehensive analysis from all batches")
+        
+        finalPrompt = FINAL_PROMPT_TEMPLATE.format(analyses=''.join(allAnalyses))
+        
+        finalResponse = generateWithRetry(model, finalPrompt, "final analysis", chunkCallback=finalChunkCallback, generationConfig=finalGenerationConfig)
+        logger.info(f"Batch analysis completed for {totalEmails} emails")
+        return finalResponse
+    except Exception as e:
+        logger.error(f"Failed to analyze email batch: {str(e)}")
+        raise
+
+# Expert system prompt, built once at import time
+EXPERT_SYSTEM_PROMPT = """You are an expert email marketing consultant with deep expertise in:
 
 1. **Email Marketing Strategy & Best Practices:**
    - Subject line optimization (A/B testing, personalization, urgency, curiosity)
@@ -307,50 +788,70 @@ def getEmailMarketingExpertSystemPrompt(emailDataContext=None):
 - Testing suggestions for validation
 
 """
-    
-    if emailDataContext:
-        basePrompt += f"""
+
+EXPERT_CONTEXT_TEMPLATE = """
 
 **Current Email Performance Context:**
 {emailDataContext}
 
 Use this context to provide specific, data-driven recommendations based on actual performance.
 """
-    
-    return basePrompt
 
-def chatWithEmailExpert(model, userQuestion, conversationHistory=None, emailDataContext=None):
+def getEmailMarketingExpertSystemPrompt(emailDataContext=None):
     """
-    Interactive chat function for consulting with the email marketing expert.
+    Get the expert system prompt for email marketing consultation.
+    Includes comprehensive knowledge about email marketing best practices.
     
     Args:
-        model: Initialized Gemini model
-        userQuestion: User's question or request
-        conversationHistory: List of previous messages for context
         emailDataContext: Optional context from analyzed emails
     
     Returns:
-        Expert response string
+        System prompt string
     """
-    try:
-        systemPrompt = getEmailMarketingExpertSystemPrompt(emailDataContext)
-        
-        # Build conversation context
-        conversationText = ""
-        if conversationHistory:
-            for msg in conversationHistory[-10:]:  # Keep last 10 messages for context
-                role = msg.get('role', 'user')
-                content = msg.get('content', '')
-                if role == 'user':
-                    conversationText += f"User: {content}\n\n"
-                elif role == 'assistant':
-                    conversationText += f"Expert: {content}\n\n"
-        
-        # Construct the full prompt
-        fullPrompt = f"""{systemPrompt}
+    if emailDataContext:
+        return EXPERT_SYSTEM_PROMPT + EXPERT_CONTEXT_TEMPLATE.format(emailDataContext=emailDataContext)
+    return EXPERT_SYSTEM_PROMPT
+
+def estimateTokenCount(text):
+    """
+    Roughly estimate the number of tokens in a text (about 4 characters per token).
+    
+    Args:
+        text: Text to measure
+    
+    Returns:
+        Estimated token count
+    """
+    return len(text) // 4 + 1
+
+def trimConversationHistory(conversationHistory, maxTokens=4000):
+    """
+    Keep the most recent conversation messages that fit within a token budget.
+    
+    Args:
+        conversationHistory: List of previous messages, oldest first
+        maxTokens: Token budget for the returned messages
+    
+    Returns:
+        List with the most recent messages that fit the budget, oldest first
+    """
+    trimmed = []
+    usedTokens = 0
+    for msg in reversed(conversationHistory or []):
+        messageTokens = estimateTokenCount(msg.get('content', ''))
+        if usedTokens + messageTokens > maxTokens:
+            break
+        trimmed.append(msg)
+        usedTokens += messageTokens
+    
+    trimmed.reverse()
+    return trimmed
+
+# Prompt for a chat question to the expert
+CHAT_PROMPT_TEMPLATE = """{systemPrompt}
 
 **Conversation History:**
-{conversationText if conversationText else "This is the start of the conversation."}
+{conversationText}
 
 **Current User Question:**
 {userQuestion}
@@ -358,80 +859,121 @@ def chatWithEmailExpert(model, userQuestion, conversationHistory=None, emailData
 **Your Response:**
 Provide a helpful, expert response that addresses the user's question. Be specific, actionable, and reference the email performance context if relevant.
 """
+
+def buildExpertChatPrompt(userQuestion, conversationHistory=None, emailDataContext=None):
+    """
+    Build the full prompt for a chat question to the email marketing expert.
+    
+    Args:
+        userQuestion: User's question or request
+        conversationHistory: List of previous messages for context
+        emailDataContext: Optional context from analyzed emails
+    
+    Returns:
+        Prompt string
+    """
+    systemPrompt = getEmailMarketingExpertSystemPrompt(emailDataContext)
+    
+    # Build conversation context from the last 10 messages; messages with other roles are skipped
+    speakers = {'user': 'User', 'assistant': 'Expert'}
+    conversationText = "".join(
+        f"{speakers[msg.get('role', 'user')]}: {msg.get('content', '')}\n\n"
+        for msg in (conversationHistory or [])[-10:]
+        if msg.get('role', 'user') in speakers
+    )
+    
+    # Construct the full prompt
+    return CHAT_PROMPT_TEMPLATE.format(
+        systemPrompt=systemPrompt,
+        conversationText=conversationText if conversationText else "This is the start of the conversation.",
+        userQuestion=userQuestion
+    )
+
+def chatWithEmailExpert(model, userQuestion, conversationHistory=None, emailDataContext=None, chunkCallback=None):
+    """
+    Interactive chat function for consulting with the email marketing expert.
+    
+    Args:
+        model: Initialized Gemini model
+        userQuestion: User's question or request
+        conversationHistory: List of previous messages for context
+        emailDataContext: Optional context from analyzed emails
+        chunkCallback: Optional callable(text) receiving the response as it streams in
+    
+    Returns:
+        Expert response string
+    """
+    try:
+        fullPrompt = buildExpertChatPrompt(userQuestion, conversationHistory, emailDataContext)
         
-        # Retry logic for quota errors
-        maxRetries = 3
-        retryDelay = 20
-        
-        for attempt in range(maxRetries):
-            try:
-                response = model.generate_content(fullPrompt)
-                logger.info("Expert consultation response generated")
-                return response.text
-            except gcp_exceptions.ResourceExhausted as e:
-                if attempt < maxRetries - 1:
-                    errorStr = str(e)
-                    if "retry in" in errorStr.lower():
-                        try:
-                            match = re.search(r'retry in ([\d.]+)s', errorStr, re.IGNORECASE)
-                            if match:
-                                retryDelay = float(match.group(1)) + 2
-                        except:
-                            pass
-                    
-                    logger.warning(f"Quota exceeded. Waiting {retryDelay:.1f} seconds before retry {attempt + 1}/{maxRetries}")
-                    time.sleep(retryDelay)
-                    retryDelay *= 1.5
-                else:
-                    logger.error(f"Failed after {maxRetries} retries")
-                    raise
-            except Exception as e:
-                logger.error(f"Failed to generate expert response: {str(e)}")
-                raise
-        
+        response = generateWithRetry(model, fullPrompt, "expert consultation", chunkCallback=chunkCallback)
+        logger.info("Expert consultation response generated")
+        return response
     except Exception as e:
         logger.error(f"Failed in chatWithEmailExpert: {str(e)}")
         raise
 
-def analyzeSingleEmailForImprovement(model, emailContent, emailSubject=None, emailMetrics=None):
+def streamChatWithEmailExpert(model, userQuestion, conversationHistory=None, emailDataContext=None):
     """
-    Analyze a single email and provide specific improvement recommendations.
+    Streaming variant of chatWithEmailExpert.
+    The request is sent immediately, retrying per-minute quota errors before the first chunk.
     
     Args:
         model: Initialized Gemini model
+        userQuestion: User's question or request
+        conversationHistory: List of previous messages for context
+        emailDataContext: Optional context from analyzed emails
+    
+    Returns:
+        Iterator over response text chunks
+    """
+    try:
+        fullPrompt = buildExpertChatPrompt(userQuestion, conversationHistory, emailDataContext)
+        response = generateStreamWithRetry(model, fullPrompt, "expert consultation")
+        logger.info("Streaming expert consultation response")
+        return response
+    except Exception as e:
+        logger.error(f"Failed in streamChatWithEmailExpert: {str(e)}")
+        raise
+
+def formatEmailForPrompt(emailContent, emailSubject=None, emailMetrics=None):
+    """
+    Format an email's subject, content and metrics for inclusion in a prompt.
+    
+    Args:
         emailContent: The email body/content to analyze
         emailSubject: Optional subject line
         emailMetrics: Optional dict with metrics (openRate, clickRate, etc.)
     
     Returns:
-        Detailed improvement recommendations
+        Formatted email section string
     """
-    try:
-        subjectSection = ""
-        if emailSubject:
-            subjectSection = f"""
+    subjectSection = ""
+    if emailSubject:
+        subjectSection = f"""
 **Subject Line:**
 {emailSubject}
 """
-        
-        metricsSection = ""
-        if emailMetrics:
-            metricsSection = f"""
+    
+    metricsSection = ""
+    if emailMetrics:
+        metricsSection = f"""
 **Current Performance Metrics:**
 - Open Rate: {emailMetrics.get('openRate', 'N/A')}%
 - Click Rate: {emailMetrics.get('clickRate', 'N/A')}%
 - Unsubscribe Rate: {emailMetrics.get('unsubRate', 'N/A')}%
 """
-        
-        systemPrompt = getEmailMarketingExpertSystemPrompt()
-        
-        prompt = f"""{systemPrompt}
-
-**Email to Analyze:**
-{subjectSection}
+    
+    return f"""{subjectSection}
 **Email Content:**
 {emailContent}
-{metricsSection}
+{metricsSection}"""
+
+# Prompt for a single-email improvement review
+IMPROVEMENT_PROMPT_TEMPLATE = """{systemPrompt}
+
+**Email to Analyze:**
+{emailSection}
 
 **Your Task:**
 Analyze this email in detail and provide specific, actionable recommendations for improvement. Focus on:
@@ -461,38 +1003,166 @@ Analyze this email in detail and provide specific, actionable recommendations fo
 
 Provide a comprehensive, actionable analysis that the email writer can immediately use to improve this email.
 """
+
+def buildImprovementPrompt(emailContent, emailSubject=None, emailMetrics=None):
+    """
+    Build the prompt asking the expert to review a single email.
+    
+    Args:
+        emailContent: The email body/content to analyze
+        emailSubject: Optional subject line
+        emailMetrics: Optional dict with metrics (openRate, clickRate, etc.)
+    
+    Returns:
+        Prompt string
+    """
+    systemPrompt = getEmailMarketingExpertSystemPrompt()
+    
+    return IMPROVEMENT_PROMPT_TEMPLATE.format(
+        systemPrompt=systemPrompt,
+        emailSection=formatEmailForPrompt(emailContent, emailSubject, emailMetrics)
+    )
+
+def analyzeSingleEmailForImprovement(model, emailContent, emailSubject=None, emailMetrics=None, generationConfig=IMPROVEMENT_GENERATION_CONFIG):
+    """
+    Analyze a single email and provide specific improvement recommendations.
+    
+    Args:
+        model: Initialized Gemini model
+        emailContent: The email body/content to analyze
+        emailSubject: Optional subject line
+        emailMetrics: Optional dict with metrics (openRate, clickRate, etc.)
+        generationConfig: Generation config dict (default: IMPROVEMENT_GENERATION_CONFIG)
+    
+    Returns:
+        Detailed improvement recommendations
+    """
+    try:
+        prompt = buildImprovementPrompt(emailContent, emailSubject, emailMetrics)
         
-        # Retry logic for quota errors
-        maxRetries = 3
-        retryDelay = 20
-        
-        for attempt in range(maxRetries):
-            try:
-                response = model.generate_content(prompt)
-                logger.info("Single email analysis completed")
-                return response.text
-            except gcp_exceptions.ResourceExhausted as e:
-                if attempt < maxRetries - 1:
-                    errorStr = str(e)
-                    if "retry in" in errorStr.lower():
-                        try:
-                            match = re.search(r'retry in ([\d.]+)s', errorStr, re.IGNORECASE)
-                            if match:
-                                retryDelay = float(match.group(1)) + 2
-                        except:
-                            pass
-                    
-                    logger.warning(f"Quota exceeded. Waiting {retryDelay:.1f} seconds before retry {attempt + 1}/{maxRetries}")
-                    time.sleep(retryDelay)
-                    retryDelay *= 1.5
-                else:
-                    logger.error(f"Failed after {maxRetries} retries")
-                    raise
-            except Exception as e:
-                logger.error(f"Failed to analyze single email: {str(e)}")
-                raise
-        
+        response = generateWithRetry(model, prompt, "single email analysis", generationConfig=generationConfig)
+        logger.info("Single email analysis completed")
+        return response
     except Exception as e:
         logger.error(f"Failed in analyzeSingleEmailForImprovement: {str(e)}")
         raise
 
+def streamSingleEmailForImprovement(model, emailContent, emailSubject=None, emailMetrics=None, generationConfig=IMPROVEMENT_GENERATION_CONFIG):
+    """
+    Streaming variant of analyzeSingleEmailForImprovement.
+    The request is sent immediately, retrying per-minute quota errors before the first chunk.
+    
+    Args:
+        model: Initialized Gemini model
+        emailContent: The email body/content to analyze
+        emailSubject: Optional subject line
+        emailMetrics: Optional dict with metrics (openRate, clickRate, etc.)
+        generationConfig: Generation config dict (default: IMPROVEMENT_GENERATION_CONFIG)
+    
+    Returns:
+        Iterator over recommendation text chunks
+    """
+    try:
+        prompt = buildImprovementPrompt(emailContent, emailSubject, emailMetrics)
+        response = generateStreamWithRetry(model, prompt, "single email analysis", generationConfig=generationConfig)
+        logger.info("Streaming single email analysis")
+        return response
+    except Exception as e:
+        logger.error(f"Failed in streamSingleEmailForImprovement: {str(e)}")
+        raise
+
+# Prompt for a batched improvement review
+BATCHED_IMPROVEMENT_PROMPT_TEMPLATE = """{systemPrompt}
+
+**Emails to Analyze:**
+{emailSections}
+
+**Your Task:**
+Analyze each email above and provide specific, actionable recommendations for improvement, covering:
+1. Subject line strengths, weaknesses and alternative options (if provided)
+2. Content structure, clarity, CTA effectiveness and engagement
+3. A prioritized list of improvements with before/after examples where helpful
+4. What's working well and what needs immediate attention
+
+Start the analysis of each email with its number on a line of its own, exactly in the form `### [n] ###`
+(for example `### [1] ###`), and answer every email in order.
+"""
+
+def buildBatchedImprovementPrompt(emails):
+    """
+    Build one prompt asking the expert to review several emails, with numbered sections to split on.
+    
+    Args:
+        emails: List of dicts with 'content' and optional 'subject' and 'metrics'
+    
+    Returns:
+        Prompt string
+    """
+    systemPrompt = getEmailMarketingExpertSystemPrompt()
+    emailSections = "\n".join(
+        f"[{index}]\n{formatEmailForPrompt(email['content'], email.get('subject'), email.get('metrics'))}"
+        for index, email in enumerate(emails, start=1)
+    )
+    
+    return BATCHED_IMPROVEMENT_PROMPT_TEMPLATE.format(systemPrompt=systemPrompt, emailSections=emailSections)
+
+def splitBatchedImprovementResponse(responseText, emailCount):
+    """
+    Split a batched improvement response into per-email analyses.
+    
+    Args:
+        responseText: Response text with `### [n] ###` section headers
+        emailCount: Number of emails in the batch
+    
+    Returns:
+        List of analysis strings in email order (None for emails missing from the response)
+    """
+    results = [None] * emailCount
+    matches = list(IMPROVEMENT_SECTION_PATTERN.finditer(responseText))
+    for position, match in enumerate(matches):
+        index = int(match.group(1)) - 1
+        end = matches[position + 1].start() if position + 1 < len(matches) else len(responseText)
+        if 0 <= index < emailCount and results[index] is None:
+            results[index] = responseText[match.end():end].strip()
+    return results
+
+def analyzeEmailsForImprovementBatched(model, emails, batchSize=8):
+    """
+    Analyze several emails for improvement with one request per batch instead of one per email.
+    The expert system prompt is sent once per batch, identical emails are analyzed once,
+    and emails missing from a batched response are analyzed individually.
+    
+    Args:
+        model: Initialized Gemini model
+        emails: List of dicts with 'content' and optional 'subject' and 'metrics'
+        batchSize: Number of emails per request (default: 8)
+    
+    Returns:
+        List of improvement recommendations, in the same order as emails
+    """
+    try:
+        emailKeys = [formatEmailForPrompt(email['content'], email.get('subject'), email.get('metrics')) for email in emails]
+        uniqueEmails = {}
+        for key, email in zip(emailKeys, emails):
+            uniqueEmails.setdefault(key, email)
+        uniqueKeys = list(uniqueEmails)
+        
+        resultsByKey = {}
+        for start in range(0, len(uniqueKeys), batchSize):
+            batchKeys = uniqueKeys[start:start + batchSize]
+            batch = [uniqueEmails[key] for key in batchKeys]
+            prompt = buildBatchedImprovementPrompt(batch)
+            response = generateWithRetry(model, prompt, "batched improvement analysis", generationConfig=IMPROVEMENT_GENERATION_CONFIG)
+            
+            batchResults = splitBatchedImprovementResponse(response, len(batch))
+            for key, email, analysis in zip(batchKeys, batch, batchResults):
+                if analysis is None:
+                    logger.warning("Email missing from batched response, analyzing it individually")
+                    analysis = analyzeSingleEmailForImprovement(model, email['content'], email.get('subject'), email.get('metrics'))
+                resultsByKey[key] = analysis
+        
+        logger.info(f"Batched improvement analysis completed for {len(emails)} emails ({len(uniqueKeys)} unique)")
+        return [resultsByKey[key] for key in emailKeys]
+    except Exception as e:
+        logger.error(f"Failed in analyzeEmailsForImprovementBatched: {str(e)}")
+        raise
@@ -1,40 +1,29 @@
 import pandas as pd
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, BigInteger
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 import os
 import logging
+import functools
 from dotenv import load_dotenv
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
-Base = declarative_base()
 
-class Message(Base):
-    """
-    SQLAlchemy model representing the messages table.
-    Maps to the existing messages table in the database.
-    """
-    __tablename__ = 'messages'
-    
-    id = Column(String, primary_key=True)
-    dlm = Column(DateTime)
-    date = Column(DateTime)
-    alias = Column(String)
-    mcsent = Column(BigInteger)
-    mcunsub = Column(BigInteger)
-    subject = Column(String)
-    mcopened = Column(BigInteger)
-    mcclicked = Column(BigInteger)
-    plaintext = Column(Text)
-    message_body = Column(Text)
-    old_resource = Column(String)
+# Columns of the messages table read for analysis
+MESSAGE_COLUMNS = [
+    'id', 'dlm', 'date', 'alias', 'mcsent', 'mcunsub', 'subject',
+    'mcopened', 'mcclicked', 'plaintext', 'message_body', 'old_resource'
+]
 
+# The IDs are bound as one array parameter (id = ANY(:ids)) instead of one parameter per ID,
+# so the statement text stays the same however many IDs are requested
+EMAIL_MESSAGES_QUERY = f"SELECT {', '.join(MESSAGE_COLUMNS)} FROM messages WHERE id = ANY(:ids)"
+
+@functools.lru_cache(maxsize=1)
 def getDatabaseEngine():
     """
     Create database engine using environment variables.
     Returns SQLAlchemy engine for database operations.
+    The engine is created once per process, so its connection pool is reused across calls.
     """
     dbHost = os.getenv("DB_HOST")
     dbPort = os.getenv("DB_PORT")
@@ -46,6 +35,9 @@ def getDatabaseEngine():
         logger.error("Missing required database environment variables")
         raise ValueError("All database environment variables must be set: DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD")
     
+    # SQLAlchemy is imported on first use rather than when this module loads
+    from sqlalchemy import create_engine
+    
     # Construct database URL (assuming PostgreSQL, adjust if needed)
     dbUrl = f"postgresql://{dbUser}:{dbPassword}@{dbHost}:{dbPort}/{dbName}"
     
@@ -57,56 +49,26 @@ def getDatabaseEngine():
         logger.error(f"Failed to create database engine: {str(e)}")
         raise
 
-def getDatabaseSession():
-    """
-    Create database session using SQLAlchemy ORM.
-    Returns a session object for database operations.
-    """
-    engine = getDatabaseEngine()
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    return session, engine
-
 def getEmailMessages():
     """
-    Extract email messages from the messages table using SQLAlchemy ORM.
+    Extract email messages from the messages table.
     Filters by specific email IDs.
+    The query runs as plain SQL and is read straight into a DataFrame,
+    without ORM sessions, instances or intermediate dictionaries.
     Returns a pandas DataFrame with email data and metrics.
     """
-    session, engine = getDatabaseSession()
+    from sqlalchemy import text
+    
+    engine = getDatabaseEngine()
     
     # Filter by specific email IDs (as strings since id is text type in database)
     targetIds = ['144', '145', '158', '159', '163', '164', '172', '174', '177', '178']
     
     try:
-        # Use SQLAlchemy ORM to query messages with ID filter
-        messages = session.query(Message).filter(Message.id.in_(targetIds)).all()
-        
-        # Convert to list of dictionaries
-        messagesData = [
-            {
-                'id': msg.id,
-                'dlm': msg.dlm,
-                'date': msg.date,
-                'alias': msg.alias,
-                'mcsent': msg.mcsent,
-                'mcunsub': msg.mcunsub,
-                'subject': msg.subject,
-                'mcopened': msg.mcopened,
-                'mcclicked': msg.mcclicked,
-                'plaintext': msg.plaintext,
-                'message_body': msg.message_body,
-                'old_resource': msg.old_resource
-            }
-            for msg in messages
-        ]
-        
-        df = pd.DataFrame(messagesData)
+        with engine.connect() as connection:
+            df = pd.read_sql(text(EMAIL_MESSAGES_QUERY), connection, params={'ids': targetIds})
         logger.info(f"Successfully extracted {len(df)} email messages from database (filtered by IDs: {targetIds})")
         return df
     except Exception as e:
         logger.error(f"Failed to extract email messages: {str(e)}")
         raise
-    finally:
-        session.close()
-        engine.dispose()
\ No newline at end of file
@@ -0,0 +1,302 @@
+import logging
+import time
+import asyncio
+import json
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Cache location and limits
+CACHE_DB_FILE = Path(__file__).resolve().parent.parent / '.cache' / 'gemini_responses.sqlite3'
+DEFAULT_TTL = 7 * 24 * 60 * 60  # seconds
+MEMORY_CACHE_SIZE = 512  # entries
+
+class ResponseCache:
+    """
+    Two-level cache for Gemini response texts: an in-memory LRU in front of a SQLite store on disk.
+    Entries are stored with their creation time and expire after the TTL given on lookup;
+    an expired entry is deleted when it is looked up, and entries older than maxAge are
+    deleted from disk when the store is opened. Safe to share between threads.
+    """
+
+    def __init__(self, dbFile=CACHE_DB_FILE, memorySize=MEMORY_CACHE_SIZE, maxAge=DEFAULT_TTL):
+        self.dbFile = Path(dbFile)
+        self.memorySize = memorySize
+        self.maxAge = maxAge
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def getConnection(self):
+        """Open the SQLite store on first use, pruning expired entries. Must be called with the lock held."""
+        if self.connection is None:
+            self.dbFile.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(str(self.dbFile), check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, created REAL NOT NULL, response TEXT NOT NULL)"
+            )
+            self.connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.maxAge,))
+            self.connection.commit()
+        return self.connection
+
+    def remember(self, key, created, response):
+        """Add an entry to the in-memory LRU, evicting the least recently used. Must be called with the lock held."""
+        self.memory[key] = (created, response)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memorySize:
+            self.memory.popitem(last=False)
+
+    def get(self, key, ttl=DEFAULT_TTL):
+        """
+        Look up a cached response.
+
+        Args:
+            key: Cache key from getCacheKey
+            ttl: Maximum entry age in seconds
+
+        Returns:
+            Cached response text, or None on a miss or expired entry
+        """
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is None:
+                try:
+                    entry = self.getConnection().execute(
+                        "SELECT created, response FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to read response cache: {str(e)}")
+                    return None
+                if entry is None:
+                    return None
+
+            created, response = entry
+            if time.time() - created >= ttl:
+                self.memory.pop(key, None)
+                try:
+                    connection = self.getConnection()
+                    connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    connection.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to delete expired response: {str(e)}")
+                return None
+
+            self.remember(key, created, response)
+        return response
+
+    def set(self, key, response):
+        """
+        Store a response in memory and on disk.
+
+        Args:
+            key: Cache key from getCacheKey
+            response: Response text
+        """
+        created = time.time()
+        with self.lock:
+            self.remember(key, created, response)
+            try:
+                connection = self.getConnection()
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses (key, created, response) VALUES (?, ?, ?)",
+                    (key, created, response)
+                )
+                connection.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to write response cache: {str(e)}")
+
+responseCache = ResponseCache()
+
+class IncompleteResponseError(ValueError):
+    """
+    Raised when Gemini finishes without returning any text, e.g. when thinking tokens use up
+    the output token cap (finish reason MAX_TOKENS) or the response is blocked.
+    """
+
+    def __init__(self, finishReason):
+        self.finishReason = finishReason
+        super().__init__(f"Gemini returned no text (finish reason: {finishReason})")
+
+def getFinishReason(response):
+    """
+    Get the finish reason of a response's first candidate as a name, e.g. 'MAX_TOKENS'.
+
+    Args:
+        response: Gemini response or streamed chunk
+
+    Returns:
+        Finish reason name, or None if the response has no candidates
+    """
+    candidates = getattr(response, 'candidates', None)
+    if not candidates:
+        return None
+    finishReason = candidates[0].finish_reason
+    return getattr(finishReason, 'name', str(finishReason))
+
+def hasResponseText(response):
+    """Check whether a response or streamed chunk carries any content parts."""
+    candidates = getattr(response, 'candidates', None)
+    return bool(candidates) and bool(candidates[0].content.parts)
+
+def getResponseText(response):
+    """
+    Get the text of a response, checking it has content before reading .text.
+    Raises IncompleteResponseError if the response carries no text.
+
+    Args:
+        response: Gemini response
+
+    Returns:
+        Response text
+    """
+    if not hasResponseText(response):
+        raise IncompleteResponseError(getFinishReason(response))
+    return response.text
+
+def iterResponseText(chunks):
+    """
+    Yield the text of streamed response chunks, skipping chunks without content
+    (such as a final chunk that only carries the finish reason).
+    Raises IncompleteResponseError if the stream ends without any text.
+
+    Args:
+        chunks: Iterator of streamed Gemini response chunks
+
+    Returns:
+        Iterator of response text chunks
+    """
+    finishReason = None
+    producedText = False
+    for chunk in chunks:
+        finishReason = getFinishReason(chunk) or finishReason
+        if hasResponseText(chunk):
+            producedText = True
+            yield chunk.text
+    if not producedText:
+        raise IncompleteResponseError(finishReason)
+
+def getCacheKey(model, prompt, generationConfig=None):
+    """
+    Build the cache key for a prompt sent to a model.
+
+    Args:
+        model: Initialized Gemini model
+        prompt: Prompt string
+        generationConfig: Optional generation config dict sent with the prompt
+
+    Returns:
+        Hex digest string
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(model.model_name.encode('utf-8'))
+    hasher.update(b'\x00')
+    if generationConfig:
+        hasher.update(json.dumps(generationConfig, sort_keys=True).encode('utf-8'))
+    hasher.update(b'\x00')
+    hasher.update(prompt.encode('utf-8'))
+    return hasher.hexdigest()
+
+def cachedGenerate(model, prompt, ttl=DEFAULT_TTL, chunkCallback=None, generationConfig=None):
+    """
+    Generate a response for a prompt, reusing a cached response for the same model and prompt.
+    Errors from the API are raised unchanged, so callers keep their retry handling.
+
+    Args:
+        model: Initialized Gemini model
+        prompt: Prompt string
+        ttl: Maximum age in seconds of a reusable response
+        chunkCallback: Optional callable(text) receiving the response as it streams in;
+            a cached response is passed in a single call
+        generationConfig: Optional generation config dict (output token cap, temperature)
+
+    Returns:
+        Response text
+    """
+    key = getCacheKey(model, prompt, generationConfig)
+    cached = responseCache.get(key, ttl)
+    if cached is not None:
+        logger.info("Using cached Gemini response")
+        if chunkCallback:
+            chunkCallback(cached)
+        return cached
+
+    if chunkCallback:
+        chunks = []
+        for text in iterResponseText(model.generate_content(prompt, generation_config=generationConfig, stream=True)):
+            chunks.append(text)
+            chunkCallback(text)
+        response = "".join(chunks)
+    else:
+        response = getResponseText(model.generate_content(prompt, generation_config=generationConfig))
+    responseCache.set(key, response)
+    return response
+
+def cachedGenerateStream(model, prompt, ttl=DEFAULT_TTL, generationConfig=None):
+    """
+    Streaming variant of cachedGenerate for callers that consume the response as an iterator,
+    such as st.write_stream. On a cache miss the request is sent before this returns, so API
+    errors are raised by the call; the response is cached once the stream has been read to the end.
+
+    Args:
+        model: Initialized Gemini model
+        prompt: Prompt string
+        ttl: Maximum age in seconds of a reusable response
+        generationConfig: Optional generation config dict (output token cap, temperature)
+
+    Returns:
+        Iterator over response text chunks (a cached response comes as a single chunk)
+    """
+    key = getCacheKey(model, prompt, generationConfig)
+    cached = responseCache.get(key, ttl)
+    if cached is not None:
+        logger.info("Using cached Gemini response")
+        return iter([cached])
+
+    chunks = model.generate_content(prompt, generation_config=generationConfig, stream=True)
+    return storeStreamedResponse(key, iterResponseText(chunks))
+
+def storeStreamedResponse(key, texts):
+    """
+    Pass streamed response text through, caching the full response once the stream is complete.
+
+    Args:
+        key: Cache key from getCacheKey
+        texts: Iterator of response text chunks
+
+    Returns:
+        Iterator of the same text chunks
+    """
+    parts = []
+    for text in texts:
+        parts.append(text)
+        yield text
+    responseCache.set(key, "".join(parts))
+
+async def cachedGenerateAsync(model, prompt, ttl=DEFAULT_TTL, generationConfig=None):
+    """
+    Async variant of cachedGenerate, running the blocking call in a worker thread on a cache miss.
+    The SDK's async client is not used: its channel binds to the first event loop, and each
+    asyncio.run call in the agent starts a new one.
+
+    Args:
+        model: Initialized Gemini model
+        prompt: Prompt string
+        ttl: Maximum age in seconds of a reusable response
+        generationConfig: Optional generation config dict (output token cap, temperature)
+
+    Returns:
+        Response text
+    """
+    key = getCacheKey(model, prompt, generationConfig)
+    cached = responseCache.get(key, ttl)
+    if cached is not None:
+        logger.info("Using cached Gemini response")
+        return cached
+
+    response = getResponseText(await asyncio.to_thread(model.generate_content, prompt, generation_config=generationConfig))
+    responseCache.set(key, response)
+    return response
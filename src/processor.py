@@ -1,9 +1,22 @@
 import pandas as pd
+import numpy as np
 import logging
 from src.database import getEmailMessages
+from src.text_cleaning import cleanEmailText
 
 logger = logging.getLogger(__name__)
 
+# Columns sent for analysis; processEmailData produces all of them for a non-empty result
+ANALYSIS_COLUMNS = [
+    'id', 'subject', 'plaintext', 'message_body',
+    'openRate', 'clickRate', 'unsubRate',
+    'mcsent', 'mcopened', 'mcclicked', 'mcunsub',
+    'effectivenessScore'
+]
+
+# Decimal places of the rates and scores sent for analysis
+PROMPT_METRIC_DECIMALS = 2
+
 def processEmailData():
     """
     Process email data from database.
@@ -18,27 +31,30 @@ def processEmailData():
             logger.warning("No email data found in database")
             return df
         
-        # Convert numeric columns to numeric type (in case they come as strings)
+        # Convert numeric columns to numeric type (in case they come as strings);
+        # the counters are small non-negative integers, so 32 bits are enough
         numericColumns = ['mcsent', 'mcopened', 'mcclicked', 'mcunsub']
         for col in numericColumns:
             if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(np.int32)
         
-        # Calculate effectiveness metrics
-        df['openRate'] = (df['mcopened'] / df['mcsent'] * 100).fillna(0)
-        df['clickRate'] = (df['mcclicked'] / df['mcsent'] * 100).fillna(0)
-        df['unsubRate'] = (df['mcunsub'] / df['mcsent'] * 100).fillna(0)
-        
-        # Filter out emails with zero sends to avoid division issues
-        df = df[df['mcsent'] > 0]
+        # Calculate effectiveness metrics in one pass over the raw arrays; rows without sends get
+        # rates of 0 and are filtered out below. Rates stay in double precision, since single
+        # precision noise (33.333335...) would show up in the prompt data
+        sent = df['mcsent'].to_numpy(dtype=np.float64)
+        counts = df[['mcopened', 'mcclicked', 'mcunsub']].to_numpy(dtype=np.float64)
+        rates = np.divide(counts, sent[:, None], out=np.zeros_like(counts), where=sent[:, None] > 0)
+        rates *= 100.0
+        df['openRate'] = rates[:, 0]
+        df['clickRate'] = rates[:, 1]
+        df['unsubRate'] = rates[:, 2]
         
         # Add effectiveness score (weighted combination of metrics)
         # Higher open and click rates are good, lower unsub rate is good
-        df['effectivenessScore'] = (
-            df['openRate'] * 0.4 + 
-            df['clickRate'] * 0.5 - 
-            df['unsubRate'] * 0.1
-        )
+        df['effectivenessScore'] = rates @ np.array([0.4, 0.5, -0.1])
+        
+        # Filter out emails with zero sends to avoid division issues
+        df = df[sent > 0]
         
         logger.info(f"Processed {len(df)} emails with effectiveness metrics")
         return df
@@ -46,6 +62,29 @@ def processEmailData():
         logger.error(f"Failed to process email data: {str(e)}")
         raise
 
+def selectByEffectiveness(df, count, largest=True):
+    """
+    Select the rows with the highest or lowest effectiveness scores, best or worst first.
+    Uses a linear-time partition and only sorts the selected rows.
+    
+    Args:
+        df: Processed email DataFrame
+        count: Number of rows to select
+        largest: Select the highest scores if True, the lowest if False
+    
+    Returns:
+        DataFrame with the selected rows
+    """
+    scores = df['effectivenessScore'].to_numpy(dtype=np.float64)
+    keys = -scores if largest else scores
+    count = min(count, len(keys))
+    if count <= 0:
+        return df.iloc[:0]
+    
+    positions = np.argpartition(keys, count - 1)[:count]
+    positions = positions[np.argsort(keys[positions], kind='stable')]
+    return df.iloc[positions]
+
 def getTopPerformingEmails(df, topN=20):
     """
     Get top performing emails based on effectiveness score.
@@ -58,7 +97,7 @@ def getTopPerformingEmails(df, topN=20):
         DataFrame with top performing emails
     """
     try:
-        topEmails = df.nlargest(topN, 'effectivenessScore')
+        topEmails = selectByEffectiveness(df, topN, largest=True)
         logger.info(f"Retrieved top {len(topEmails)} performing emails")
         return topEmails
     except Exception as e:
@@ -77,7 +116,7 @@ def getWorstPerformingEmails(df, worstN=20):
         DataFrame with worst performing emails
     """
     try:
-        worstEmails = df.nsmallest(worstN, 'effectivenessScore')
+        worstEmails = selectByEffectiveness(df, worstN, largest=False)
         logger.info(f"Retrieved worst {len(worstEmails)} performing emails")
         return worstEmails
     except Exception as e:
@@ -90,23 +129,24 @@ def prepareEmailDataForAnalysis(df):
     Selects relevant fields and formats them for the AI agent.
     
     Args:
-        df: Processed email DataFrame
+        df: Processed email DataFrame, as returned by processEmailData
     
     Returns:
         List of dictionaries with formatted email data
     """
     try:
-        # Select relevant columns for analysis
-        analysisColumns = [
-            'id', 'subject', 'plaintext', 'message_body', 
-            'openRate', 'clickRate', 'unsubRate', 
-            'mcsent', 'mcopened', 'mcclicked', 'mcunsub',
-            'effectivenessScore'
-        ]
+        # An empty result of processEmailData carries no metric columns
+        if df.empty:
+            logger.info("No emails to prepare for analysis")
+            return []
+        
+        # Select relevant columns for analysis; rates are rounded so the prompt carries no float noise
+        formattedData = df[ANALYSIS_COLUMNS].round(PROMPT_METRIC_DECIMALS).to_dict('records')
         
-        # Filter to only include columns that exist
-        availableColumns = [col for col in analysisColumns if col in df.columns]
-        formattedData = df[availableColumns].to_dict('records')
+        # Send readable text rather than raw HTML, capped at EMAIL_TEXT_CHAR_LIMIT
+        for record in formattedData:
+            record['plaintext'] = cleanEmailText(record['plaintext'])
+            record['message_body'] = cleanEmailText(record['message_body'])
         
         logger.info(f"Prepared {len(formattedData)} emails for analysis")
         return formattedData
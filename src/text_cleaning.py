@@ -0,0 +1,32 @@
+import re
+import html
+
+# Longest email text passed to Gemini, in characters
+EMAIL_TEXT_CHAR_LIMIT = 2000
+
+# Markup that carries no readable text: comments and script/style/head blocks
+HTML_HIDDEN_PATTERN = re.compile(r'<!--.*?-->|<(script|style|head)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+def cleanEmailText(text, maxLength=EMAIL_TEXT_CHAR_LIMIT):
+    """
+    Reduce an email body to its readable text for a prompt.
+    Strips HTML markup, decodes entities, collapses whitespace and truncates, so prompts
+    are not filled with styles and markup that add tokens but no content.
+    
+    Args:
+        text: Plaintext or HTML email body
+        maxLength: Maximum length of the result in characters, or None for no limit
+    
+    Returns:
+        Cleaned text (empty string for missing values)
+    """
+    if not isinstance(text, str):
+        return ''
+    if '<' in text:
+        text = HTML_TAG_PATTERN.sub(' ', HTML_HIDDEN_PATTERN.sub(' ', text))
+    if '&' in text:
+        text = html.unescape(text)
+    text = WHITESPACE_PATTERN.sub(' ', text).strip()
+    return text[:maxLength] if maxLength is not None else text
@@ -0,0 +1,165 @@
+import threading
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import src.agent as agent
+import src.llm_cache as llm_cache
+from src.agent import analyzeEmailBatch
+
+
+class FakeResponse:
+    """Minimal stand-in for a Gemini response with a single candidate; empty text means no parts."""
+
+    def __init__(self, text, finishReason='STOP'):
+        self.candidates = [SimpleNamespace(
+            content=SimpleNamespace(parts=[text] if text else []),
+            finish_reason=SimpleNamespace(name=finishReason)
+        )]
+        self._text = text
+
+    @property
+    def text(self):
+        if not self._text:
+            raise ValueError("The response has no parts")
+        return self._text
+
+
+class FakeModel:
+    """
+    Model double that only answers through the blocking generate_content call.
+    The async method fails if used, since an async client binds to the first event loop.
+    """
+
+    model_name = 'models/fake-model'
+
+    def __init__(self, emptyMarker=None):
+        self.prompts = []
+        self.lock = threading.Lock()
+        self.emptyMarker = emptyMarker
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        with self.lock:
+            self.prompts.append(prompt)
+            if self.emptyMarker and self.emptyMarker in prompt:
+                # Thinking used up the output budget before any visible text
+                response = FakeResponse('', finishReason='MAX_TOKENS')
+            else:
+                response = FakeResponse(f"analysis {len(self.prompts)}")
+        return iter([response]) if stream else response
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        raise AssertionError("generate_content_async must not be used")
+
+
+def makeEmails(prefix, count):
+    return pd.DataFrame({
+        'subject': [f"{prefix} subject {i}" for i in range(count)],
+        'plaintext': [f"{prefix} body {i}" for i in range(count)],
+        'message_body': [f"<p>{prefix} body {i}</p>" for i in range(count)],
+        'mcsent': [100 + i for i in range(count)],
+        'mcopened': [40 + i for i in range(count)],
+        'mcclicked': [5 + i for i in range(count)],
+        'mcunsub': [1 for _ in range(count)],
+    })
+
+
+@pytest.fixture(autouse=True)
+def isolatedResponseCache(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, 'responseCache', llm_cache.ResponseCache(tmp_path / 'responses.sqlite3'))
+
+
+def test_analyze_email_batch_runs_twice_in_one_process():
+    model = FakeModel()
+
+    for prefix in ['first', 'second']:
+        result = analyzeEmailBatch(makeEmails(prefix, 6), model, batchSize=2, requestsPerMinute=6000)
+        assert result.startswith('analysis')
+
+    # Each run sends 3 batch prompts and 1 final prompt
+    assert len(model.prompts) == 8
+
+
+def test_analyze_email_batch_skips_batch_without_text():
+    model = FakeModel(emptyMarker='first subject 0')
+
+    result = analyzeEmailBatch(makeEmails('first', 6), model, batchSize=2, requestsPerMinute=6000)
+
+    assert result.startswith('analysis')
+    finalPrompt = model.prompts[-1]
+    assert finalPrompt.count('ANALYSIS ---') == 2
+
+
+def test_initialize_agent_lists_models_once_per_process(monkeypatch):
+    import google.generativeai as genai
+
+    listCalls = []
+
+    def listModels():
+        listCalls.append(1)
+        return [SimpleNamespace(name='models/gemini-2.5-flash', supported_generation_methods=['generateContent'])]
+
+    monkeypatch.setenv('GEMINI_API_KEY', 'test-key')
+    monkeypatch.setattr(genai, 'configure', lambda **kwargs: None)
+    monkeypatch.setattr(genai, 'GenerativeModel', lambda name: SimpleNamespace(model_name=name))
+    monkeypatch.setattr(genai, 'list_models', listModels)
+    agent.initializeGeminiAgent.cache_clear()
+
+    try:
+        model = agent.initializeGeminiAgent()
+        assert agent.getSharedModel() is model
+    finally:
+        agent.initializeGeminiAgent.cache_clear()
+
+    assert model.model_name == 'gemini-2.5-flash'
+    assert len(listCalls) == 1
+
+
+class QuotaLimitedModel(FakeModel):
+    """Model double whose first streamed requests fail with the given quota error."""
+
+    def __init__(self, quotaError, failures=1):
+        super().__init__()
+        self.quotaError = quotaError
+        self.failures = failures
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        if self.failures:
+            self.failures -= 1
+            raise self.quotaError
+        return super().generate_content(prompt, generation_config, stream)
+
+
+def test_stream_chat_retries_per_minute_quota_errors(monkeypatch):
+    import google.api_core.exceptions as gcp_exceptions
+
+    delays = []
+    monkeypatch.setattr(agent.time, 'sleep', delays.append)
+    model = QuotaLimitedModel(gcp_exceptions.ResourceExhausted("Quota exceeded. Please retry in 3s."))
+
+    response = ''.join(agent.streamChatWithEmailExpert(model, "How can I improve my open rates?"))
+
+    assert response.startswith('analysis')
+    assert delays == [5.0]
+
+
+def test_stream_chat_does_not_retry_daily_quota_errors(monkeypatch):
+    import google.api_core.exceptions as gcp_exceptions
+
+    monkeypatch.setattr(agent.time, 'sleep', lambda delay: pytest.fail("daily quota errors must not be retried"))
+    model = QuotaLimitedModel(gcp_exceptions.ResourceExhausted("Quota exceeded for GenerateRequestsPerDayPerProjectPerModel-FreeTier"))
+
+    with pytest.raises(gcp_exceptions.ResourceExhausted):
+        agent.streamChatWithEmailExpert(model, "How can I improve my open rates?")
+
+
+def test_stream_chat_reuses_cached_response():
+    model = FakeModel()
+
+    first = ''.join(agent.streamChatWithEmailExpert(model, "What makes a good subject line?"))
+    second = ''.join(agent.streamChatWithEmailExpert(model, "What makes a good subject line?"))
+    warmed = agent.chatWithEmailExpert(model, "What makes a good subject line?")
+
+    assert first == second == warmed
+    assert len(model.prompts) == 1
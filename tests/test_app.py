@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import src.agent as agent
+import src.llm_cache as llm_cache
+from test_agent import FakeModel
+
+APP_FILE = Path(__file__).resolve().parent.parent / 'app.py'
+CHAT_LOG_DIR = APP_FILE.parent / '.cache' / 'chat_logs'
+
+
+@pytest.fixture
+def fakeModel(tmp_path, monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(agent, 'getSharedModel', lambda: model)
+    monkeypatch.setattr(llm_cache, 'responseCache', llm_cache.ResponseCache(tmp_path / 'responses.sqlite3'))
+    st.cache_resource.clear()
+    yield model
+    st.cache_resource.clear()
+
+
+def test_chat_submit_records_an_exchange(fakeModel):
+    app = AppTest.from_file(str(APP_FILE), default_timeout=30).run()
+    try:
+        app.chat_input(key='chat_question').set_value("How can I improve my open rates?").run()
+
+        assert not app.exception
+        history = app.session_state.conversation_history
+        assert [message['role'] for message in history] == ['user', 'assistant']
+        assert history[1]['content'].startswith('analysis')
+        assert not app.session_state.processing
+    finally:
+        (CHAT_LOG_DIR / f"{app.session_state.chat_id}.jsonl").unlink(missing_ok=True)
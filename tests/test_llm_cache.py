@@ -0,0 +1,28 @@
+import sqlite3
+
+from src.llm_cache import ResponseCache
+
+
+def countRows(dbFile):
+    with sqlite3.connect(str(dbFile)) as connection:
+        return connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def test_expired_entry_is_deleted_on_lookup(tmp_path):
+    dbFile = tmp_path / 'responses.sqlite3'
+    cache = ResponseCache(dbFile)
+    cache.set('key', 'response')
+
+    assert cache.get('key', ttl=0) is None
+    assert 'key' not in cache.memory
+    assert countRows(dbFile) == 0
+
+
+def test_old_entries_are_pruned_when_the_store_opens(tmp_path):
+    dbFile = tmp_path / 'responses.sqlite3'
+    ResponseCache(dbFile).set('key', 'response')
+
+    reopened = ResponseCache(dbFile, maxAge=0)
+
+    assert reopened.get('key') is None
+    assert countRows(dbFile) == 0